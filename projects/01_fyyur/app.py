@@ -2,19 +2,30 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import csv
+import io
 import json
+import sys
+import time
+import hashlib
 import dateutil.parser
+from itertools import groupby
 from datetime import datetime
+from functools import lru_cache, wraps
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+import click
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context, session, make_response
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import and_, cast, func, or_, tuple_
 from sqlalchemy.dialects import postgresql
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from cache import create_cache
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -25,6 +36,10 @@ app.config.from_object('config')
 db = SQLAlchemy(app)
 
 migrate = Migrate(app, db)
+page_cache = create_cache(app.config)
+
+SHOWS_PER_PAGE = 30
+SEARCH_RESULTS_PER_PAGE = 30
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -64,22 +79,252 @@ class Show(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
-    start_time = db.Column(db.String())
+    start_time = db.Column(db.DateTime(timezone=True))
+    __table_args__ = (
+      db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+      db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+    )
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+def parse_datetime(value):
+  # ISO-8601 strings, which is what the app stores, skip the dateutil parser
+  if isinstance(value, datetime):
+    return value
+  try:
+    return datetime.fromisoformat(value)
+  except ValueError:
+    return dateutil.parser.parse(value)
+
+@lru_cache(maxsize=None)
+def get_datetime_pattern(format, locale):
+  # parses the babel pattern and locale once per (format, locale)
+  pattern = babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+  return pattern, babel.Locale.parse(locale)
+
+@lru_cache(maxsize=4096)
+def format_datetime(value, format='medium', locale=None):
+  # the same show times are rendered on every listing, so results are memoized
+  date = parse_datetime(value)
+  if format in ('short', 'long'):
+    return babel.dates.format_datetime(date, format, locale=locale or babel.dates.LC_TIME)
+  pattern, locale = get_datetime_pattern(format, locale or babel.dates.LC_TIME)
+  return pattern.apply(date, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def get_past_and_upcoming_shows(owner_column, owner_id, other, other_column, prefix):
+  # returns (past_shows, upcoming_shows) for the venue or artist owner_id from a
+  # single range scan on the (owner, start_time) index, with the other side of the
+  # show joined in and the past/upcoming flag computed by the database, so the cost
+  # does not grow with the number of shows.
+  upcoming = (Show.start_time >= func.now()).label('upcoming')
+  rows = db.session.query(
+      other_column,
+      other.name,
+      other.image_link,
+      Show.start_time,
+      upcoming
+    ).join(other, other.id == other_column) \
+    .filter(owner_column == owner_id) \
+    .order_by(Show.start_time, Show.id)
+
+  past_shows = []
+  upcoming_shows = []
+  for other_id, name, image_link, start_time, is_upcoming in rows:
+    show = {
+      prefix + "_id": other_id,
+      prefix + "_name": name,
+      prefix + "_image_link": image_link,
+      "start_time": start_time
+    }
+    if is_upcoming:
+      upcoming_shows.append(show)
+    else:
+      past_shows.append(show)
+  return past_shows, upcoming_shows
+
+def get_venue_shows(venue_id):
+  return get_past_and_upcoming_shows(Show.venue_id, venue_id, Artist, Show.artist_id, 'artist')
+
+def get_artist_shows(artist_id):
+  return get_past_and_upcoming_shows(Show.artist_id, artist_id, Venue, Show.venue_id, 'venue')
+
+def search_match_and_rank(columns, search_term):
+  # returns (match, rank) clauses for a search over columns.
+  # with TRIGRAM_SEARCH the pg_trgm GIN indexes serve both the substring match and
+  # the typo tolerant word similarity match, and results are ranked by similarity.
+  # prefix matches always rank first.
+  prefix = func.coalesce(cast(or_(*[column.ilike(search_term + '%') for column in columns]), db.Integer), 0)
+  substring = or_(*[column.ilike('%' + search_term + '%') for column in columns])
+  if not app.config.get('TRIGRAM_SEARCH'):
+    return substring, prefix
+
+  similar = or_(*[column.op('%>')(search_term) for column in columns])
+  similarity = func.greatest(*[func.word_similarity(search_term, column) for column in columns])
+  return or_(substring, similar), prefix + func.coalesce(similarity, 0)
+
+def search_with_upcoming_shows(model, owner_column, columns, search_term, page=1, per_page=SEARCH_RESULTS_PER_PAGE):
+  # returns (count, results) for one ranked page of a venue or artist search.
+  # the page of matches is picked first, then left joined to its upcoming shows and
+  # grouped, so the aggregate only ever runs over per_page rows.
+  match, rank = search_match_and_rank(columns, search_term)
+  matches = db.session.query(model.id, model.name, rank.label('rank')) \
+    .filter(match) \
+    .order_by(rank.desc(), model.name, model.id) \
+    .offset((page - 1) * per_page) \
+    .limit(per_page) \
+    .subquery()
+  rows = db.session.query(
+      matches.c.id,
+      matches.c.name,
+      func.count(Show.id)
+    ).outerjoin(Show, and_(owner_column == matches.c.id, Show.start_time >= func.now())) \
+    .group_by(matches.c.id, matches.c.name, matches.c.rank) \
+    .order_by(matches.c.rank.desc(), matches.c.name, matches.c.id)
+
+  results = [{
+    "id": entity_id,
+    "name": name,
+    "num_upcoming_shows": num_upcoming_shows
+  } for entity_id, name, num_upcoming_shows in rows]
+  count = db.session.query(func.count(model.id)).filter(match).scalar()
+  return count, results
+
+def get_venue_areas():
+  # returns the venues grouped into areas by (state, city) from one ordered query,
+  # each venue carrying its number of upcoming shows.
+  rows = db.session.query(
+      Venue.state,
+      Venue.city,
+      Venue.id,
+      Venue.name,
+      func.count(Show.id)
+    ).outerjoin(Show, and_(Show.venue_id == Venue.id, Show.start_time >= func.now())) \
+    .group_by(Venue.id) \
+    .order_by(Venue.state, Venue.city, Venue.name, Venue.id)
+
+  areas = []
+  for (state, city), venues in groupby(rows, key=lambda row: (row[0], row[1])):
+    areas.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": venue_id,
+        "name": name,
+        "num_upcoming_shows": num_upcoming_shows
+      } for _, _, venue_id, name, num_upcoming_shows in venues]
+    })
+  return areas
+
+def get_shows_page(after=None, limit=SHOWS_PER_PAGE):
+  # returns (shows, next_page) for one page of the shows listing.
+  # show, venue and artist columns come from a single joined query, and the page
+  # starts strictly after the (start_time, id) cursor so no rows are skipped over.
+  query = db.session.query(
+      Show.id,
+      Show.venue_id,
+      Venue.name,
+      Show.artist_id,
+      Artist.name,
+      Artist.image_link,
+      Show.start_time
+    ).join(Venue, Venue.id == Show.venue_id) \
+    .join(Artist, Artist.id == Show.artist_id)
+  if after is not None:
+    query = query.filter(tuple_(Show.start_time, Show.id) > tuple_(*after))
+  rows = query.order_by(Show.start_time, Show.id).limit(limit + 1).all()
+
+  next_page = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_page = {"after_time": rows[-1].start_time.isoformat(), "after_id": rows[-1].id}
+
+  data = [{
+    "venue_id": venue_id,
+    "venue_name": venue_name,
+    "artist_id": artist_id,
+    "artist_name": artist_name,
+    "artist_image_link": artist_image_link,
+    "start_time": start_time
+  } for show_id, venue_id, venue_name, artist_id, artist_name, artist_image_link, start_time in rows]
+  return data, next_page
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def stream_template(template_name, **context):
+  # renders a template in chunks so large listings are sent as they are rendered.
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  stream = template.stream(context)
+  stream.enable_buffering(5)
+  return stream
+
+def cached_page(key):
+  # serves a read page from page_cache. key is formatted with the view arguments,
+  # e.g. 'venue:{venue_id}', or is a function of them returning the key. cached
+  # pages carry an ETag so repeat visitors get a 304 without the page being
+  # rendered or sent again. a streamed page is rendered in full before it is
+  # cached, so a cached view is never streamed.
+  def decorator(f):
+    @wraps(f)
+    def wrapper(**kwargs):
+      # pages showing flashed messages belong to a single visitor
+      if not app.config.get('PAGE_CACHE') or session.get('_flashes'):
+        return f(**kwargs)
+
+      cache_key = key(**kwargs) if callable(key) else key.format(**kwargs)
+      entry = page_cache.get(cache_key)
+      if entry is None:
+        response = make_response(f(**kwargs))
+        if response.status_code != 200:
+          return response
+        body = response.get_data()
+        entry = (hashlib.sha1(body).hexdigest(), body)
+        page_cache.set(cache_key, entry)
+
+      etag, body = entry
+      response = Response(body, mimetype='text/html')
+      response.set_etag(etag)
+      return response.make_conditional(request)
+    return wrapper
+  return decorator
+
+def venue_page_keys(venue_id):
+  # cache keys of the pages showing a venue: its own page, the venue and show
+  # listings and the pages of the artists playing there
+  artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+  return ['venue:{}'.format(venue_id), 'venues', 'shows:'] + \
+    ['artist:{}'.format(artist_id) for artist_id, in artist_ids]
+
+def artist_page_keys(artist_id):
+  # cache keys of the pages showing an artist: its own page, the artist and show
+  # listings and the pages of the venues the artist plays at
+  venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+  return ['artist:{}'.format(artist_id), 'artists', 'shows:'] + \
+    ['venue:{}'.format(venue_id) for venue_id, in venue_ids]
+
+def invalidate_pages(keys):
+  # keys ending in ':' drop every page in that namespace, e.g. all /shows pages
+  for key in keys:
+    if key.endswith(':'):
+      page_cache.delete_prefix(key)
+    else:
+      page_cache.delete(key)
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -93,73 +338,35 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cached_page('venues')
 def venues():
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  cities = db.session.query(Venue.city).distinct()
-  data =[]
-  for city in cities:
-    venues = Venue.query.filter_by(city=city)
-    v_result = []
-    for venue in venues:
-      v_result.append({
-        "id": venue.id,
-        "name": venue.name
-      })
-    data.append({
-      "city": venues[0].city,
-      "state": venues[0].state,
-      "venues": v_result
-    })
-  return render_template('pages/venues.html', areas=data)
+  return render_template('pages/venues.html', areas=get_venue_areas())
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  search_term = request.form.get('search_term')
-  venues = Venue.query.filter(Venue.name.ilike('%'+search_term+'%')).all()
-  data = []
-  for venue in venues:
-    num_upcoming_shows = 0
-    for show in venue.shows:
-      if str(datetime.today()) > show.start_time:
-        num_upcoming_shows += 1
-    data.append({
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": num_upcoming_shows
-    })
+  search_term = request.form.get('search_term', '')
+  page = request.form.get('page', 1, type=int)
+  count, data = search_with_upcoming_shows(Venue, Show.venue_id, [Venue.name, Venue.city], search_term, page)
 
   response={
-    "count": len(venues),
-    "data": data
+    "count": count,
+    "data": data,
+    "page": page,
+    "has_next": page * SEARCH_RESULTS_PER_PAGE < count
   }
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/venues/<int:venue_id>')
+@cached_page('venue:{venue_id}')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   venue = Venue.query.filter_by(id=venue_id).first()
-  shows = venue.shows
-  past_shows = []
-  upcoming_shows = []
-  for show in shows:
-    artist = Artist.query.filter_by(id=show.artist_id).first()
-    if str(datetime.today()) > show.start_time:
-      past_shows.append({
-        "artist_id": show.artist_id,
-        "artist_name": artist.name,
-        "artist_image_link": artist.image_link,
-        "start_time": show.start_time
-      })
-    else:
-      upcoming_shows.append({
-        "artist_id": show.artist_id,
-        "artist_name": artist.name,
-        "artist_image_link": artist.image_link,
-        "start_time": show.start_time
-      })
-    
+  if venue is None:
+    abort(404)
+
+  past_shows, upcoming_shows = get_venue_shows(venue_id)
   data = {
     "id": venue.id,
     "name": venue.name,
@@ -202,6 +409,7 @@ def create_venue_submission():
     venue = Venue(name=name, city=city, state=state, address=address, phone=phone, genres=genres, image_link=image_link, facebook_link=facebook_link)
     db.session.add(venue)
     db.session.commit()
+    invalidate_pages(['venues'])
     # on successful db insert, flash success
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
   except:
@@ -215,16 +423,18 @@ def create_venue_submission():
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   try:
-        venue = Venue.query.get(venue_id)
-        db.session.delete(venue)
-        db.session.commit()
-        flash('Venue ' + venue.name + ' was successfully deleted!')
-    except:
-        db.session.rollback()
-        flash('Venue ' + venue.name + ' could not be deleted.')
-    finally:
-        db.session.close()
-    return render_template('pages/home.html')
+    venue = Venue.query.get(venue_id)
+    keys = venue_page_keys(venue_id)
+    db.session.delete(venue)
+    db.session.commit()
+    invalidate_pages(keys)
+    flash('Venue ' + venue.name + ' was successfully deleted!')
+  except:
+    db.session.rollback()
+    flash('Venue ' + venue.name + ' could not be deleted.')
+  finally:
+    db.session.close()
+  return render_template('pages/home.html')
 
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
@@ -233,6 +443,7 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cached_page('artists')
 def artists():
   data = []
   artists = Artist.query.all()
@@ -247,50 +458,27 @@ def artists():
 def search_artists():
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
-  search_term = request.form.get('search_term')
-  artists = Artist.query.filter(Artist.name.ilike('%'+search_term+'%')).all()
-  data = []
-  for artist in artists:
-    num_upcoming_shows = 0
-    for show in artist.shows:
-      if str(datetime.today()) > show.start_time:
-        num_upcoming_shows += 1
-    data.append({
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": num_upcoming_shows
-    })
+  search_term = request.form.get('search_term', '')
+  page = request.form.get('page', 1, type=int)
+  count, data = search_with_upcoming_shows(Artist, Show.artist_id, [Artist.name], search_term, page)
 
   response={
-    "count": len(artists),
-    "data": data
+    "count": count,
+    "data": data,
+    "page": page,
+    "has_next": page * SEARCH_RESULTS_PER_PAGE < count
   }
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
+@cached_page('artist:{artist_id}')
 def show_artist(artist_id):
   # shows the venue page with the given venue_id
   artist = Artist.query.filter_by(id=artist_id).first()
-  shows = artist.shows
-  past_shows = []
-  upcoming_shows = []
-  for show in shows:
-    venue = Venue.query.filter_by(id=show.venue_id).first()
-    if str(datetime.today()) > show.start_time:
-      past_shows.append({
-        "venue_id": show.venue_id,
-        "venue_name": venue.name,
-        "venue_image_link": venue.image_link,
-        "start_time": show.start_time
-      })
-    else:
-      upcoming_shows.append({
-        "venue_id": show.venue_id,
-        "venue_name": venue.name,
-        "venue_image_link": venue.image_link,
-        "start_time": show.start_time
-      })
-    
+  if artist is None:
+    abort(404)
+
+  past_shows, upcoming_shows = get_artist_shows(artist_id)
   data = {
     "id": artist.id,
     "name": artist.name,
@@ -334,7 +522,7 @@ def edit_artist(artist_id):
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
-
+  invalidate_pages(artist_page_keys(artist_id))
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
@@ -361,6 +549,7 @@ def edit_venue(venue_id):
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
+  invalidate_pages(venue_page_keys(venue_id))
   return redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
@@ -386,6 +575,7 @@ def create_artist_submission():
     artist = Artist(name=name, city=city, state=state, phone=phone, genres=genres, image_link=image_link, facebook_link=facebook_link)
     db.session.add(artist)
     db.session.commit()
+    invalidate_pages(['artists'])
     # on successful db insert, flash success
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
   except:
@@ -400,60 +590,28 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
-def shows():
-  # displays list of shows at /shows
+def shows_page_after():
+  # the (start_time, id) of the last show of the previous /shows page, None on the first page
+  after_time = request.args.get('after_time', type=dateutil.parser.parse)
+  after_id = request.args.get('after_id', type=int)
+  return (after_time, after_id) if after_time is not None and after_id is not None else None
 
-  shows = Show.query.all()
-  data = []
-  for show in shows:
-    data.append({
-      "venue_id": show.venue_id,
-      "venue_name": Venue.query.filter_by(id=show.venue_id).first().name,
-      "artist_id": show.artist_id,
-      "artist_name": Artist.query.filter_by(id=show.artist_id).first().name,
-      "artist_image_link": Artist.query.filter_by(id=show.artist_id).first().image_link,
-      "start_time": show.start_time
-    })
+def shows_page_key():
+  # cache key of a /shows page, built from the parsed position only so other
+  # query parameters neither grow the key nor add cache entries
+  after = shows_page_after()
+  if after is None:
+    return 'shows:'
+  return 'shows:{}:{}'.format(after[0].isoformat(), after[1])
 
-
-  # data=[{
-  #   "venue_id": 1,
-  #   "venue_name": "The Musical Hop",
-  #   "artist_id": 4,
-  #   "artist_name": "Guns N Petals",
-  #   "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-  #   "start_time": "2019-05-21T21:30:00.000Z"
-  # }, {
-  #   "venue_id": 3,
-  #   "venue_name": "Park Square Live Music & Coffee",
-  #   "artist_id": 5,
-  #   "artist_name": "Matt Quevedo",
-  #   "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-  #   "start_time": "2019-06-15T23:00:00.000Z"
-  # }, {
-  #   "venue_id": 3,
-  #   "venue_name": "Park Square Live Music & Coffee",
-  #   "artist_id": 6,
-  #   "artist_name": "The Wild Sax Band",
-  #   "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-  #   "start_time": "2035-04-01T20:00:00.000Z"
-  # }, {
-  #   "venue_id": 3,
-  #   "venue_name": "Park Square Live Music & Coffee",
-  #   "artist_id": 6,
-  #   "artist_name": "The Wild Sax Band",
-  #   "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-  #   "start_time": "2035-04-08T20:00:00.000Z"
-  # }, {
-  #   "venue_id": 3,
-  #   "venue_name": "Park Square Live Music & Coffee",
-  #   "artist_id": 6,
-  #   "artist_name": "The Wild Sax Band",
-  #   "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-  #   "start_time": "2035-04-15T20:00:00.000Z"
-  # }]
-  return render_template('pages/shows.html', shows=data)
+@app.route('/shows')
+@cached_page(shows_page_key)
+def shows():
+  # displays list of shows at /shows, one page at a time.
+  # pages are keyed on the (start_time, id) of the last show of the previous page.
+  data, next_page = get_shows_page(shows_page_after())
+  return Response(stream_with_context(
+    stream_template('pages/shows.html', shows=data, next_page=next_page)))
 
 @app.route('/shows/create')
 def create_shows():
@@ -472,6 +630,7 @@ def create_show_submission():
     show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
     db.session.add(show)
     db.session.commit()
+    invalidate_pages(['venue:{}'.format(venue_id), 'artist:{}'.format(artist_id), 'venues', 'shows:'])
     # on successful db insert, flash success
     flash('Show was successfully listed!')
   except:
@@ -501,6 +660,141 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+IMPORTS = {
+  'venues': (Venue, VenueForm),
+  'artists': (Artist, ArtistForm),
+  'shows': (Show, ShowForm),
+}
+
+def read_rows(path):
+  # streams (row, error) pairs from a CSV file with a header line or a JSON lines file
+  with open(path, newline='') as f:
+    if path.endswith('.csv'):
+      for row in csv.DictReader(f):
+        yield row, None
+    else:
+      for line in f:
+        if not line.strip():
+          continue
+        try:
+          yield json.loads(line), None
+        except ValueError as e:
+          yield None, 'invalid JSON: {}'.format(e)
+
+def copy_value(value):
+  # formats a value for COPY ... WITH (FORMAT csv)
+  if isinstance(value, list):
+    return '{' + ','.join('"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value) + '}'
+  if isinstance(value, datetime):
+    return value.isoformat()
+  return value
+
+def copy_rows(table, columns, rows):
+  # loads a batch through Postgres COPY on the session's connection
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for row in rows:
+    writer.writerow([copy_value(row[column]) for column in columns])
+  buffer.seek(0)
+  cursor = db.session.connection().connection.cursor()
+  try:
+    cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(table.name, ', '.join(columns)), buffer)
+  finally:
+    cursor.close()
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(IMPORTS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per transaction.')
+@click.option('--method', type=click.Choice(['copy', 'executemany']), default='copy', show_default=True,
+              help='COPY needs Postgres, executemany works everywhere.')
+@click.option('--rejects', type=click.File('w'), help='Write rejected rows to this file as JSON lines.')
+def import_data(kind, path, batch_size, method, rejects):
+  """Bulk load venues, artists or shows from a CSV or JSON lines file.
+
+  Rows are checked with the same rules as the matching form and loaded in
+  batches, one transaction per batch.
+
+  Cached pages are dropped only with PAGE_CACHE='filesystem', which the web
+  workers share. The 'memory' cache lives in each worker, so running servers
+  show the imported rows once PAGE_CACHE_TTL has passed or after a restart.
+  """
+  model, form_class = IMPORTS[kind]
+  table = model.__table__
+  validate = compile_row_validator(form_class)
+
+  # shows must point at existing venues and artists, load the ids once
+  if model is Show:
+    venue_ids = set(venue_id for venue_id, in db.session.query(Venue.id))
+    artist_ids = set(artist_id for artist_id, in db.session.query(Artist.id))
+
+  def reject(line_number, row, errors):
+    counts['rejected'] += 1
+    if rejects:
+      rejects.write(json.dumps({'line': line_number, 'row': row, 'errors': errors}, default=str) + '\n')
+    elif counts['rejected'] <= 10:
+      click.echo('line {}: {}'.format(line_number, '; '.join(errors)), err=True)
+
+  def flush(batch):
+    if not batch:
+      return
+    rows = [values for line_number, row, values in batch]
+    try:
+      if method == 'copy':
+        copy_rows(table, list(rows[0]), rows)
+      else:
+        db.session.execute(table.insert(), rows)
+      db.session.commit()
+      counts['imported'] += len(rows)
+    except Exception as e:
+      db.session.rollback()
+      for line_number, row, values in batch:
+        reject(line_number, row, ['batch failed: {}'.format(e)])
+    elapsed = time.perf_counter() - started
+    click.echo('{} imported, {} rejected, {:.0f} rows/sec'.format(
+      counts['imported'], counts['rejected'], (counts['imported'] + counts['rejected']) / elapsed))
+
+  counts = {'imported': 0, 'rejected': 0}
+  started = time.perf_counter()
+  batch = []
+  for line_number, (row, error) in enumerate(read_rows(path), 1):
+    if error:
+      reject(line_number, row, [error])
+      continue
+    values, errors = validate(row)
+    if not errors and model is Show:
+      try:
+        values['venue_id'] = int(values['venue_id'])
+        values['artist_id'] = int(values['artist_id'])
+      except ValueError:
+        errors.append('venue_id and artist_id must be integers.')
+      else:
+        if values['venue_id'] not in venue_ids:
+          errors.append('venue_id: no venue {}.'.format(values['venue_id']))
+        if values['artist_id'] not in artist_ids:
+          errors.append('artist_id: no artist {}.'.format(values['artist_id']))
+    if errors:
+      reject(line_number, row, errors)
+      continue
+    batch.append((line_number, row, values))
+    if len(batch) >= batch_size:
+      flush(batch)
+      batch = []
+  flush(batch)
+
+  if app.config.get('PAGE_CACHE') == 'filesystem':
+    page_cache.clear()
+  elif app.config.get('PAGE_CACHE'):
+    click.echo('note: running servers keep their in-memory page cache, restart them or wait {}s to see the import'.format(
+      app.config.get('PAGE_CACHE_TTL', 300)))
+  elapsed = time.perf_counter() - started
+  click.echo('done: {} {} imported, {} rejected in {:.1f}s'.format(
+    counts['imported'], kind, counts['rejected'], elapsed))
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
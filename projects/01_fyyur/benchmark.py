@@ -0,0 +1,145 @@
+#----------------------------------------------------------------------------#
+# Benchmarks for the Fyyur data access layer.
+#
+# Run them against a scratch database that has been migrated to head, never
+# against a database you care about, e.g.
+#
+#   export DATABASE_URL=postgresql://localhost:5432/fyyur_bench
+#   FLASK_APP=app flask db upgrade
+#   python benchmark.py search --rows 1000000
+#   python benchmark.py datetime --shows 10000
+#----------------------------------------------------------------------------#
+
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+import babel.dates
+import dateutil.parser
+from sqlalchemy import text
+
+from app import app, db, Venue, Artist, Show, search_with_upcoming_shows, format_datetime
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def timed(fn, repeat):
+  # returns the wall clock time of each call in milliseconds
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    timings.append((time.perf_counter() - start) * 1000)
+  return timings
+
+def report(label, timings):
+  p95 = sorted(timings)[max(0, int(len(timings) * 0.95) - 1)]
+  print('{:<40} median {:>9.2f} ms   p95 {:>9.2f} ms'.format(label, statistics.median(timings), p95))
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+SEARCH_TERMS = ['hop', 'blue room', 'midnite', 'garage 12345', 'velvet', 'a']
+
+def populate_search(rows):
+  # tops the venues and artists tables up to rows synthetic rows each
+  for table, names, places in [
+    ('venues',
+     "(ARRAY['The Blue','Red','Golden','Silent','Electric','Velvet','Midnight','Crystal'])[1 + i % 8]"
+     " || ' ' || (ARRAY['Hop','Room','Hall','Lounge','Garage','Cellar','Stage','Tavern','Club'])[1 + (i / 8) % 9]",
+     "(ARRAY['San Francisco','New York','Austin','Chicago','Seattle','Nashville'])[1 + i % 6]"),
+    ('artists',
+     "(ARRAY['The Wild','Guns N','Matt','Crimson','Lazy','Neon','Broken','Sonic'])[1 + i % 8]"
+     " || ' ' || (ARRAY['Sax Band','Petals','Quevedo','Tide','Owls','Riders','Hearts','Echo','Kids'])[1 + (i / 8) % 9]",
+     "(ARRAY['San Francisco','New York','Austin','Chicago','Seattle','Nashville'])[1 + i % 6]")]:
+    existing = db.session.execute(text('SELECT count(*) FROM ' + table)).scalar()
+    if existing >= rows:
+      continue
+    print('inserting {} rows into {}'.format(rows - existing, table))
+    db.session.execute(text(
+      'INSERT INTO {table} (name, city, state) '
+      "SELECT {names} || ' ' || i, {places}, 'CA' "
+      'FROM generate_series(:start, :stop) AS i'.format(table=table, names=names, places=places)),
+      {'start': existing + 1, 'stop': rows})
+    db.session.commit()
+    db.session.execute(text('ANALYZE ' + table))
+    db.session.commit()
+
+def bench_search(args):
+  populate_search(args.rows)
+  backends = [False]
+  if db.session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar():
+    backends.append(True)
+  else:
+    print('pg_trgm is not installed, only the ILIKE backend is measured')
+
+  for trigram in backends:
+    app.config['TRIGRAM_SEARCH'] = trigram
+    backend = 'trigram' if trigram else 'ilike'
+    for term in SEARCH_TERMS:
+      report('{} venues "{}"'.format(backend, term), timed(
+        lambda: search_with_upcoming_shows(Venue, Show.venue_id, [Venue.name, Venue.city], term), args.repeat))
+      report('{} artists "{}"'.format(backend, term), timed(
+        lambda: search_with_upcoming_shows(Artist, Show.artist_id, [Artist.name], term), args.repeat))
+
+#----------------------------------------------------------------------------#
+# Datetime filter.
+#----------------------------------------------------------------------------#
+
+def legacy_format_datetime(value, format='medium'):
+  # the filter as it was before it was memoized, kept for comparison
+  date = value if isinstance(value, datetime) else dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+def bench_datetime(args):
+  # renders a shows page of args.shows rows, spread over a year of evenings
+  first = datetime(2035, 4, 1, 20, 0, tzinfo=timezone.utc)
+  shows = [{
+    "venue_id": 1,
+    "venue_name": "The Musical Hop",
+    "artist_id": 4,
+    "artist_name": "Guns N Petals",
+    "artist_image_link": "https://example.com/guns.jpg",
+    "start_time": (first + timedelta(days=i % 365)).isoformat()
+  } for i in range(args.shows)]
+  template = app.jinja_env.get_template('pages/shows.html')
+
+  for label, filter in [('dateutil + babel per call', legacy_format_datetime), ('memoized', format_datetime)]:
+    app.jinja_env.filters['datetime'] = filter
+    if hasattr(filter, 'cache_clear'):
+      filter.cache_clear()
+    with app.test_request_context('/shows'):
+      timings = timed(lambda: template.render(shows=shows, next_page=None), args.repeat)
+    report('{} ({} shows)'.format(label, args.shows), timings)
+    print('{:<40} {:>10.0f} rows/sec'.format('', args.shows / (statistics.median(timings) / 1000)))
+  app.jinja_env.filters['datetime'] = format_datetime
+
+#----------------------------------------------------------------------------#
+# Launch.
+#----------------------------------------------------------------------------#
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Fyyur benchmarks')
+  subparsers = parser.add_subparsers(dest='benchmark')
+  subparsers.required = True
+
+  search = subparsers.add_parser('search', help='venue and artist search latency')
+  search.add_argument('--rows', type=int, default=1000000, help='synthetic venues and artists')
+  search.add_argument('--repeat', type=int, default=20, help='runs per search term')
+  search.set_defaults(run=bench_search)
+
+  filter = subparsers.add_parser('datetime', help='format_datetime filter throughput on a shows page')
+  filter.add_argument('--shows', type=int, default=10000, help='shows on the rendered page')
+  filter.add_argument('--repeat', type=int, default=5, help='renders to time')
+  filter.set_defaults(run=bench_datetime)
+
+  args = parser.parse_args()
+  with app.app_context():
+    args.run(args)
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+#----------------------------------------------------------------------------#
+# Page cache backends.
+#
+# Every backend stores values under string keys for at most `ttl` seconds and
+# keeps no more than `max_entries` of them, evicting the least recently used.
+# Keys are namespaced like 'venue:1' so related pages can be dropped together
+# with delete_prefix.
+#----------------------------------------------------------------------------#
+
+class NullCache:
+  # used when caching is switched off, never holds anything
+  def get(self, key):
+    return None
+
+  def set(self, key, value):
+    pass
+
+  def delete(self, key):
+    pass
+
+  def delete_prefix(self, prefix):
+    pass
+
+  def clear(self):
+    pass
+
+
+class MemoryCache:
+  # in-process cache, shared by the threads of one worker
+  def __init__(self, max_entries=512, ttl=300):
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return None
+      expires, value = entry
+      if expires < time.monotonic():
+        del self.entries[key]
+        return None
+      self.entries.move_to_end(key)
+      return value
+
+  def set(self, key, value):
+    with self.lock:
+      self.entries[key] = (time.monotonic() + self.ttl, value)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+
+  def delete(self, key):
+    with self.lock:
+      self.entries.pop(key, None)
+
+  def delete_prefix(self, prefix):
+    with self.lock:
+      for key in [key for key in self.entries if key.startswith(prefix)]:
+        del self.entries[key]
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+
+class FileSystemCache:
+  # one file per key in `directory`, shared by every worker on the host.
+  # the file modification time doubles as the last access time for LRU eviction.
+  # files are named after the key's namespace (up to the first ':') and a hash
+  # of the key, which keeps names short however long the key is, so
+  # delete_prefix takes a namespace such as 'shows:'.
+  suffix = '.cache'
+
+  def __init__(self, directory, max_entries=512, ttl=300):
+    self.directory = directory
+    self.max_entries = max_entries
+    self.ttl = ttl
+    os.makedirs(directory, exist_ok=True)
+
+  def path(self, key):
+    namespace = key.partition(':')[0] + ':'
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(self.directory, quote(namespace, safe='') + digest + self.suffix)
+
+  def files(self):
+    return [os.path.join(self.directory, name)
+            for name in os.listdir(self.directory) if name.endswith(self.suffix)]
+
+  def remove(self, path):
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      pass
+
+  def last_used(self, path):
+    try:
+      return os.stat(path).st_mtime
+    except FileNotFoundError:
+      return 0
+
+  def get(self, key):
+    path = self.path(key)
+    try:
+      with open(path, 'rb') as f:
+        expires, value = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+      return None
+    if expires < time.time():
+      self.remove(path)
+      return None
+    try:
+      os.utime(path)
+    except FileNotFoundError:
+      pass
+    return value
+
+  def set(self, key, value):
+    path = self.path(key)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+      pickle.dump((time.time() + self.ttl, value), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+    files = self.files()
+    if len(files) > self.max_entries:
+      files.sort(key=self.last_used)
+      for path in files[:len(files) - self.max_entries]:
+        self.remove(path)
+
+  def delete(self, key):
+    self.remove(self.path(key))
+
+  def delete_prefix(self, prefix):
+    prefix = quote(prefix, safe='')
+    for path in self.files():
+      if os.path.basename(path).startswith(prefix):
+        self.remove(path)
+
+  def clear(self):
+    for path in self.files():
+      self.remove(path)
+
+
+def create_cache(config):
+  # builds the backend named by PAGE_CACHE ('memory', 'filesystem' or None)
+  backend = config.get('PAGE_CACHE')
+  max_entries = config.get('PAGE_CACHE_MAX_ENTRIES', 512)
+  ttl = config.get('PAGE_CACHE_TTL', 300)
+  if backend == 'memory':
+    return MemoryCache(max_entries, ttl)
+  if backend == 'filesystem':
+    return FileSystemCache(config['PAGE_CACHE_DIR'], max_entries, ttl)
+  return NullCache()
@@ -7,6 +7,21 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 DEBUG = True
 
 # Connect to the database
-SQLALCHEMY_DATABASE_URI = 'postgres://maxroitblat@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgres://maxroitblat@localhost:5432/fyyur')
 
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Use the pg_trgm indexes for ranked, typo tolerant search.
+# Requires the pg_trgm extension, which the migrations enable.
+TRIGRAM_SEARCH = True
+
+# Cache rendered read pages: 'memory', 'filesystem' or None to turn it off (the default).
+# 'memory' is per process: with several workers a create or delete only drops the
+# pages cached by the worker that handled it, the others serve their copy until
+# PAGE_CACHE_TTL passes. 'filesystem' is shared by every worker on the host.
+# A cached page is rendered in full once and then sent from the cache, so with a
+# cache /shows is no longer streamed.
+PAGE_CACHE = os.environ.get('PAGE_CACHE')
+PAGE_CACHE_DIR = os.path.join(basedir, '.page_cache')
+PAGE_CACHE_TTL = 300
+PAGE_CACHE_MAX_ENTRIES = 512
@@ -1,7 +1,8 @@
 from datetime import datetime
 from flask_wtf import Form
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms.fields.core import UnboundField
+from wtforms.validators import DataRequired, AnyOf, URL, ValidationError, StopValidation
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -216,3 +217,83 @@ class ArtistForm(Form):
         # TODO implement enum restriction
         'facebook_link', validators=[URL()]
     )
+
+
+#----------------------------------------------------------------------------#
+# Row validation.
+#----------------------------------------------------------------------------#
+
+class RowField:
+    # the parts of a bound field that WTForms validators read, so plain dicts
+    # can be checked against a form's rules without building a form per row
+    def __init__(self, data):
+        self.data = data
+        self.raw_data = [data]
+        self.errors = []
+
+    def gettext(self, string):
+        return string
+
+    def ngettext(self, singular, plural, n):
+        return singular if n == 1 else plural
+
+
+def compile_row_validator(form_class):
+    # reads the fields, validators and choices of form_class once and returns
+    # validate(row) -> (values, errors) applying the same rules to a dict
+    fields = []
+    for name in dir(form_class):
+        unbound = getattr(form_class, name)
+        if not isinstance(unbound, UnboundField):
+            continue
+        choices = unbound.kwargs.get('choices')
+        datetime_format = unbound.kwargs.get('format', '%Y-%m-%d %H:%M:%S')
+        if isinstance(datetime_format, (list, tuple)):
+            datetime_format = datetime_format[0]
+        fields.append((
+            name,
+            unbound.field_class,
+            unbound.kwargs.get('validators') or [],
+            set(value for value, label in choices) if choices else None,
+            datetime_format
+        ))
+
+    def validate(row):
+        values = {}
+        errors = []
+        for name, field_class, validators, choices, datetime_format in fields:
+            data = row.get(name)
+            invalid = False
+            if issubclass(field_class, SelectMultipleField):
+                if isinstance(data, str):
+                    data = [value.strip() for value in data.split(',') if value.strip()]
+                data = data or []
+                invalid = choices is not None and any(value not in choices for value in data)
+            elif issubclass(field_class, SelectField):
+                data = data or ''
+                invalid = choices is not None and data not in choices
+            elif issubclass(field_class, DateTimeField):
+                if data and not isinstance(data, datetime):
+                    try:
+                        data = datetime.strptime(str(data), datetime_format)
+                    except ValueError:
+                        errors.append('{}: Not a valid datetime value.'.format(name))
+                        continue
+                data = data or None
+            else:
+                data = '' if data is None else str(data)
+
+            field = RowField(data)
+            try:
+                for validator in validators:
+                    validator(None, field)
+            except (ValidationError, StopValidation) as e:
+                errors.append('{}: {}'.format(name, e))
+                continue
+            if invalid:
+                errors.append('{}: Not a valid choice.'.format(name))
+                continue
+            values[name] = data
+        return values, errors
+
+    return validate
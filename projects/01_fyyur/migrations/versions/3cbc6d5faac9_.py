@@ -0,0 +1,32 @@
+"""add pg_trgm indexes for venue and artist search
+
+Revision ID: 3cbc6d5faac9
+Revises: 572a83e73c5c
+Create Date: 2026-10-18 10:02:17.550931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3cbc6d5faac9'
+down_revision = '572a83e73c5c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_venues_name_trgm', 'venues', ['name'],
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_venues_city_trgm', 'venues', ['city'],
+                    postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'})
+    op.create_index('ix_artists_name_trgm', 'artists', ['name'],
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_artists_name_trgm', table_name='artists')
+    op.drop_index('ix_venues_city_trgm', table_name='venues')
+    op.drop_index('ix_venues_name_trgm', table_name='venues')
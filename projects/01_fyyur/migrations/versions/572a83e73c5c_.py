@@ -0,0 +1,50 @@
+"""store shows.start_time as timestamptz and index it per venue and artist
+
+Revision ID: 572a83e73c5c
+Revises: ca253cad6c8d
+Create Date: 2026-10-18 09:12:41.203518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import dateutil.parser
+from dateutil import tz
+
+
+# revision identifiers, used by Alembic.
+revision = '572a83e73c5c'
+down_revision = 'ca253cad6c8d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('start_time_tz', sa.DateTime(timezone=True), nullable=True))
+
+    # backfill with dateutil so every format the string column accepted still parses.
+    # values without an offset are taken as UTC.
+    conn = op.get_bind()
+    updates = []
+    for show_id, start_time in conn.execute(sa.text('SELECT id, start_time FROM shows')):
+        if not start_time:
+            continue
+        parsed = dateutil.parser.parse(start_time)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=tz.tzutc())
+        updates.append({'id': show_id, 'start_time': parsed})
+    if updates:
+        conn.execute(sa.text('UPDATE shows SET start_time_tz = :start_time WHERE id = :id'), updates)
+
+    op.drop_column('shows', 'start_time')
+    op.alter_column('shows', 'start_time_tz', new_column_name='start_time')
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'])
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'])
+
+
+def downgrade():
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
+    op.alter_column('shows', 'start_time',
+               existing_type=sa.DateTime(timezone=True),
+               type_=sa.String(),
+               postgresql_using='to_char(start_time AT TIME ZONE \'UTC\', \'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"\')')
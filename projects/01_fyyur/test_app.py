@@ -0,0 +1,441 @@
+import json
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+os.environ.setdefault('DATABASE_URL', 'postgresql://localhost:5432/fyyur_test')
+os.environ.setdefault('PAGE_CACHE', 'memory')
+
+import babel.dates
+import dateutil.parser
+from sqlalchemy import event, text
+
+from cache import MemoryCache, FileSystemCache
+
+from app import app, db, page_cache, Venue, Artist, Show, SHOWS_PER_PAGE, SEARCH_RESULTS_PER_PAGE, get_venue_areas, search_venues, search_artists, format_datetime
+
+#----------------------------------------------------------------------------#
+# Setup of Unittest
+#----------------------------------------------------------------------------#
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize a clean database."""
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+        # ranked trigram search needs the pg_trgm extension on the test server
+        self.has_trigram = db.session.execute(
+            text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar() is not None
+        if self.has_trigram:
+            db.session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        app.config['TRIGRAM_SEARCH'] = self.has_trigram
+        page_cache.clear()
+
+        self.venue = Venue(name='The Musical Hop', city='San Francisco', state='CA', genres=['Jazz'])
+        self.artist = Artist(name='Guns N Petals', city='San Francisco', state='CA', genres=['Rock n Roll'],
+                             image_link='https://example.com/guns.jpg')
+        db.session.add_all([self.venue, self.artist])
+        db.session.commit()
+
+    def tearDown(self):
+        """Executed after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def add_shows(self, count, start_time):
+        db.session.add_all([
+            Show(venue_id=self.venue.id, artist_id=self.artist.id, start_time=start_time)
+            for _ in range(count)
+        ])
+        db.session.commit()
+
+    def count_queries(self, path):
+        """GET path and return the response with the number of SQL statements it ran."""
+        statements = []
+        page_cache.clear()
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            res = self.client().get(path)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return res, len(statements)
+
+    def render_context(self, view, path, data):
+        """POST data to view and return the context it passed to the template."""
+        with app.test_request_context(path, method='POST', data=data):
+            with unittest.mock.patch('app.render_template') as render_template:
+                view()
+        return render_template.call_args[1]
+
+#----------------------------------------------------------------------------#
+# Tests for /venues GET
+#----------------------------------------------------------------------------#
+
+    def test_venues_grouped_by_area(self):
+        """Test /venues groups venues by state and city with their upcoming show counts."""
+        db.session.add_all([
+            Venue(name='Park Square Live Music & Coffee', city='San Francisco', state='CA'),
+            Venue(name='The Dueling Pianos Bar', city='New York', state='NY'),
+        ])
+        db.session.commit()
+        self.add_shows(2, '2035-04-01T20:00:00.000Z')
+        self.add_shows(1, '2019-05-21T21:30:00.000Z')
+
+        areas = get_venue_areas()
+        self.assertEqual([(area['state'], area['city']) for area in areas],
+                         [('CA', 'San Francisco'), ('NY', 'New York')])
+        self.assertEqual([venue['name'] for venue in areas[0]['venues']],
+                         ['Park Square Live Music & Coffee', 'The Musical Hop'])
+        self.assertEqual(areas[0]['venues'][1]['num_upcoming_shows'], 2)
+        self.assertEqual(areas[0]['venues'][0]['num_upcoming_shows'], 0)
+
+    def test_venues_query_count_is_constant(self):
+        """Test the number of queries per /venues render does not grow with the number of cities."""
+        res, few_cities = self.count_queries('/venues')
+        self.assertEqual(res.status_code, 200)
+
+        db.session.add_all([Venue(name='Venue {}'.format(i), city='City {}'.format(i), state='CA')
+                            for i in range(50)])
+        db.session.commit()
+        res, many_cities = self.count_queries('/venues')
+        self.assertEqual(res.status_code, 200)
+
+        self.assertEqual(few_cities, many_cities)
+
+#----------------------------------------------------------------------------#
+# Tests for /venues/<venue_id> GET
+#----------------------------------------------------------------------------#
+
+    def test_show_venue_splits_past_and_upcoming(self):
+        """Test the venue page lists past and upcoming shows separately."""
+        self.add_shows(2, '2019-05-21T21:30:00.000Z')
+        self.add_shows(3, '2035-04-01T20:00:00.000Z')
+
+        res = self.client().get('/venues/{}'.format(self.venue.id))
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('3 Upcoming Shows', body)
+        self.assertIn('2 Past Shows', body)
+        self.assertIn('Guns N Petals', body)
+
+    def test_show_venue_query_count_is_constant(self):
+        """Test the number of queries per render does not grow with the number of shows."""
+        self.add_shows(1, '2019-05-21T21:30:00.000Z')
+        res, few_shows = self.count_queries('/venues/{}'.format(self.venue.id))
+        self.assertEqual(res.status_code, 200)
+
+        self.add_shows(50, '2019-05-21T21:30:00.000Z')
+        self.add_shows(50, '2035-04-01T20:00:00.000Z')
+        res, many_shows = self.count_queries('/venues/{}'.format(self.venue.id))
+        self.assertEqual(res.status_code, 200)
+
+        self.assertEqual(few_shows, many_shows)
+        # the venue, then its past and upcoming shows together
+        self.assertEqual(many_shows, 2)
+
+    def test_404_show_venue(self):
+        """Test 404 for a venue which does not exist."""
+        res = self.client().get('/venues/1234567879')
+
+        self.assertEqual(res.status_code, 404)
+
+#----------------------------------------------------------------------------#
+# Tests for /artists/<artist_id> GET
+#----------------------------------------------------------------------------#
+
+    def test_show_artist_splits_past_and_upcoming(self):
+        """Test the artist page lists past and upcoming shows separately."""
+        self.add_shows(1, '2019-05-21T21:30:00.000Z')
+        self.add_shows(2, '2035-04-01T20:00:00.000Z')
+
+        res = self.client().get('/artists/{}'.format(self.artist.id))
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('2 Upcoming Shows', body)
+        self.assertIn('1 Past Show', body)
+        self.assertIn('The Musical Hop', body)
+
+#----------------------------------------------------------------------------#
+# Tests for /venues/search and /artists/search POST
+#----------------------------------------------------------------------------#
+
+    def test_search_counts_only_upcoming_shows(self):
+        """Test search results count upcoming shows and ignore past ones."""
+        self.add_shows(2, '2019-05-21T21:30:00.000Z')
+        self.add_shows(3, '2035-04-01T20:00:00.000Z')
+
+        results = self.render_context(search_venues, '/venues/search', {'search_term': 'hop'})['results']
+        self.assertEqual(results['count'], 1)
+        self.assertEqual(results['data'][0]['num_upcoming_shows'], 3)
+
+        results = self.render_context(search_artists, '/artists/search', {'search_term': 'petals'})['results']
+        self.assertEqual(results['count'], 1)
+        self.assertEqual(results['data'][0]['num_upcoming_shows'], 3)
+
+    def test_search_is_paginated(self):
+        """Test search returns one page of results with the total count."""
+        db.session.add_all([Artist(name='Band {}'.format(i)) for i in range(SEARCH_RESULTS_PER_PAGE + 5)])
+        db.session.commit()
+
+        results = self.render_context(search_artists, '/artists/search', {'search_term': 'band'})['results']
+        self.assertEqual(results['count'], SEARCH_RESULTS_PER_PAGE + 5)
+        self.assertEqual(len(results['data']), SEARCH_RESULTS_PER_PAGE)
+        self.assertTrue(results['has_next'])
+
+        results = self.render_context(search_artists, '/artists/search', {'search_term': 'band', 'page': 2})['results']
+        self.assertEqual(results['count'], SEARCH_RESULTS_PER_PAGE + 5)
+        self.assertEqual(len(results['data']), 5)
+        self.assertFalse(results['has_next'])
+        self.assertEqual(results['data'][0]['num_upcoming_shows'], 0)
+
+    def test_search_ranks_prefix_matches_first(self):
+        """Test names starting with the search term are listed before other matches."""
+        db.session.add_all([Artist(name='The Jazz Band'), Artist(name='Jazz Hands')])
+        db.session.commit()
+
+        results = self.render_context(search_artists, '/artists/search', {'search_term': 'jazz'})['results']
+        self.assertEqual([artist['name'] for artist in results['data']], ['Jazz Hands', 'The Jazz Band'])
+
+    def test_search_tolerates_typos(self):
+        """Test trigram search finds names with a misspelled search term."""
+        if not self.has_trigram:
+            self.skipTest('pg_trgm is not available')
+
+        results = self.render_context(search_artists, '/artists/search', {'search_term': 'petels'})['results']
+        self.assertEqual(results['count'], 1)
+        self.assertEqual(results['data'][0]['name'], 'Guns N Petals')
+
+    def test_search_venues_by_city(self):
+        """Test venue search also matches the venue city."""
+        results = self.render_context(search_venues, '/venues/search', {'search_term': 'francisco'})['results']
+        self.assertEqual(results['count'], 1)
+        self.assertEqual(results['data'][0]['name'], 'The Musical Hop')
+
+#----------------------------------------------------------------------------#
+# Tests for /shows GET
+#----------------------------------------------------------------------------#
+
+    def test_shows_keyset_pagination(self):
+        """Test /shows pages through every show exactly once."""
+        self.add_shows(SHOWS_PER_PAGE + 5, '2035-04-01T20:00:00.000Z')
+
+        res = self.client().get('/shows')
+        body = res.get_data(as_text=True)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(body.count('tile-show'), SHOWS_PER_PAGE)
+        self.assertIn('after_id=', body)
+
+        last_show = Show.query.order_by(Show.start_time, Show.id).all()[SHOWS_PER_PAGE - 1]
+        res = self.client().get('/shows', query_string={
+            'after_time': last_show.start_time,
+            'after_id': last_show.id
+        })
+        body = res.get_data(as_text=True)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(body.count('tile-show'), 5)
+        self.assertNotIn('after_id=', body)
+
+    def test_shows_query_count_is_constant(self):
+        """Test the number of queries per /shows render does not grow with the number of shows."""
+        self.add_shows(1, '2035-04-01T20:00:00.000Z')
+        res, few_shows = self.count_queries('/shows')
+        self.assertEqual(res.status_code, 200)
+
+        self.add_shows(100, '2035-04-01T20:00:00.000Z')
+        res, many_shows = self.count_queries('/shows')
+        self.assertEqual(res.status_code, 200)
+
+        self.assertEqual(few_shows, many_shows)
+
+#----------------------------------------------------------------------------#
+# Tests for the datetime filter
+#----------------------------------------------------------------------------#
+
+    def test_format_datetime_matches_babel(self):
+        """Test the cached filter renders the same text as babel for strings and datetimes."""
+        start_time = '2035-04-01T20:00:00.000Z'
+        for format, pattern in [('full', "EEEE MMMM, d, y 'at' h:mma"), ('medium', "EE MM, dd, y h:mma")]:
+            expected = babel.dates.format_datetime(dateutil.parser.parse(start_time), pattern)
+            self.assertEqual(format_datetime(start_time, format), expected)
+            self.assertEqual(format_datetime(dateutil.parser.parse(start_time), format), expected)
+
+    def test_format_datetime_is_memoized(self):
+        """Test repeated values are served from the cache."""
+        format_datetime.cache_clear()
+        for _ in range(3):
+            format_datetime('2019-05-21T21:30:00.000Z', 'full')
+
+        self.assertEqual(format_datetime.cache_info().hits, 2)
+        self.assertEqual(format_datetime.cache_info().misses, 1)
+
+#----------------------------------------------------------------------------#
+# Tests for the page cache
+#----------------------------------------------------------------------------#
+
+    def test_cached_page_skips_the_database(self):
+        """Test a cached page is served again without running any query."""
+        self.add_shows(2, '2035-04-01T20:00:00.000Z')
+        path = '/venues/{}'.format(self.venue.id)
+        first = self.client().get(path)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            second = self.client().get(path)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.get_data(), first.get_data())
+        self.assertEqual(statements, [])
+
+    def test_cached_page_not_modified(self):
+        """Test a repeat visitor presenting the ETag gets a 304 without a body."""
+        res = self.client().get('/artists')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/artists', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.get_data(), b'')
+
+    def test_create_show_invalidates_pages(self):
+        """Test creating a show drops the cached pages of its venue, artist and the show listing."""
+        venue_path = '/venues/{}'.format(self.venue.id)
+        artist_path = '/artists/{}'.format(self.artist.id)
+        for path in [venue_path, artist_path, '/shows']:
+            self.client().get(path)
+
+        res = self.client().post('/shows/create', data={
+            'venue_id': self.venue.id,
+            'artist_id': self.artist.id,
+            'start_time': '2035-04-01 20:00:00'
+        })
+        self.assertEqual(res.status_code, 200)
+
+        self.assertIn('1 Upcoming Show', self.client().get(venue_path).get_data(as_text=True))
+        self.assertIn('1 Upcoming Show', self.client().get(artist_path).get_data(as_text=True))
+        self.assertIn('Guns N Petals', self.client().get('/shows').get_data(as_text=True))
+
+    def test_memory_cache_evicts_least_recently_used(self):
+        """Test the in-process backend keeps max_entries and drops the least recently used."""
+        cache = MemoryCache(max_entries=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_filesystem_cache_expires_and_evicts(self):
+        """Test the filesystem backend honours the TTL, LRU eviction and prefix deletes."""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = FileSystemCache(directory, max_entries=2, ttl=60)
+            cache.set('shows:', 1)
+            cache.set('shows:after_id=3', 2)
+            os.utime(cache.path('shows:'), (0, 0))
+            cache.set('venue:1', 3)
+            self.assertIsNone(cache.get('shows:'))
+            self.assertEqual(cache.get('shows:after_id=3'), 2)
+
+            cache.delete_prefix('shows:')
+            self.assertIsNone(cache.get('shows:after_id=3'))
+            self.assertEqual(cache.get('venue:1'), 3)
+
+            cache.ttl = -1
+            cache.set('venue:2', 4)
+            self.assertIsNone(cache.get('venue:2'))
+
+    def test_filesystem_cache_long_keys(self):
+        """Test keys longer than a file name are stored and still dropped by their namespace."""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = FileSystemCache(directory, max_entries=2, ttl=60)
+            key = 'shows:' + 'a' * 300
+            cache.set(key, 1)
+            self.assertEqual(cache.get(key), 1)
+
+            cache.delete_prefix('shows:')
+            self.assertIsNone(cache.get(key))
+
+    def test_shows_cache_key_ignores_other_parameters(self):
+        """Test /shows pages are cached by their position, not by the raw query string."""
+        self.add_shows(2, '2035-04-01T20:00:00.000Z')
+        self.client().get('/shows?utm_source=' + 'x' * 300)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            res = self.client().get('/shows?ref=newsletter')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(statements, [])
+
+#----------------------------------------------------------------------------#
+# Tests for the import-data command
+#----------------------------------------------------------------------------#
+
+    def write_file(self, suffix, content):
+        f = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        f.write(content)
+        f.close()
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_import_venues_rejects_invalid_rows(self):
+        """Test venues are loaded with COPY and rows failing the VenueForm rules are rejected."""
+        path = self.write_file('.jsonl', '\n'.join([
+            json.dumps({'name': 'Park Square Live Music & Coffee', 'city': 'San Francisco', 'state': 'CA',
+                        'address': '34 Whiskey Moore Ave', 'genres': ['Rock n Roll', 'Jazz'],
+                        'image_link': 'https://example.com/park.jpg',
+                        'facebook_link': 'https://www.facebook.com/ParkSquareLiveMusicAndCoffee'}),
+            json.dumps({'name': 'No Address', 'city': 'San Francisco', 'state': 'ZZ', 'genres': ['Jazz'],
+                        'image_link': 'https://example.com/x.jpg', 'facebook_link': 'not a url'}),
+            '{not json'
+        ]))
+
+        result = app.test_cli_runner().invoke(args=['import-data', 'venues', path])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('1 venues imported, 2 rejected', result.output)
+        venue = Venue.query.filter_by(name='Park Square Live Music & Coffee').one()
+        self.assertEqual(venue.genres, ['Rock n Roll', 'Jazz'])
+
+    def test_import_shows_with_executemany(self):
+        """Test shows are loaded from CSV and rows pointing at unknown venues are rejected."""
+        path = self.write_file('.csv', 'venue_id,artist_id,start_time\n'
+                                       '{venue},{artist},2035-04-01 20:00:00\n'
+                                       '1234567879,{artist},2035-04-01 20:00:00\n'
+                                       '{venue},{artist},tomorrow\n'.format(venue=self.venue.id, artist=self.artist.id))
+
+        result = app.test_cli_runner().invoke(
+            args=['import-data', 'shows', path, '--method', 'executemany', '--batch-size', '1'])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('1 shows imported, 2 rejected', result.output)
+        self.assertEqual(Show.query.count(), 1)
+
+# Make the tests conveniently executable.
+# From the project directory, run 'python test_app.py' to start tests
+if __name__ == "__main__":
+    unittest.main()
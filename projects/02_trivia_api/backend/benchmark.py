@@ -0,0 +1,135 @@
+#----------------------------------------------------------------------------#
+# Benchmarks for the trivia API.
+#
+# Run them against a scratch database, never against the trivia database,
+# e.g.
+#
+#   createdb trivia_bench
+#   python benchmark.py search --rows 1000000
+#   python benchmark.py json --page-size 1000
+#----------------------------------------------------------------------------#
+
+import argparse
+import statistics
+import time
+
+from flask import Flask, jsonify
+from sqlalchemy import text
+
+import serializer
+from models import setup_db, db, Question
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def timed(fn, repeat):
+  # returns the wall clock time of each call in milliseconds
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    timings.append((time.perf_counter() - start) * 1000)
+  return timings
+
+def report(label, timings):
+  p95 = sorted(timings)[max(0, int(len(timings) * 0.95) - 1)]
+  print('{:<45} median {:>9.2f} ms   p95 {:>9.2f} ms'.format(label, statistics.median(timings), p95))
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+SEARCH_TERMS = ['title', 'peanut butter', 'hematology', 'who invented', 'xylophone 4242']
+
+def populate_search(rows):
+  # tops the questions table up to rows synthetic questions
+  existing = db.session.execute(text('SELECT count(*) FROM questions')).scalar()
+  if existing >= rows:
+    return
+  print('inserting {} questions'.format(rows - existing))
+  db.session.execute(text(
+    "INSERT INTO questions (question, answer, category, difficulty) "
+    "SELECT (ARRAY['Who invented','What is the title of','Which country has','How many','Where was'])[1 + i % 5]"
+    " || ' ' || (ARRAY['peanut butter','the movie','hematology','the largest lake','the xylophone','jazz'])[1 + (i / 5) % 6]"
+    " || ' ' || i || '?', "
+    "(ARRAY['George Washington Carver','Apollo 13','Blood','Lake Victoria','Percussion','Maya Angelou'])[1 + (i / 7) % 6], "
+    "(1 + i % 6)::text, 1 + i % 5 "
+    "FROM generate_series(:start, :stop) AS i"),
+    {'start': existing + 1, 'stop': rows})
+  db.session.commit()
+  db.session.execute(text('ANALYZE questions'))
+  db.session.commit()
+
+def ilike_page(term):
+  # the substring search the endpoint used before, with a full count
+  selection = Question.query.filter(Question.question.ilike('%{}%'.format(term)))
+  [question.format() for question in selection.order_by(Question.id).limit(10)]
+  selection.count()
+
+def search_page(term):
+  selection = Question.search(term)
+  [question.format() for question in selection.order_by(Question.id).limit(10)]
+  selection.order_by(None).count()
+
+def bench_search(args):
+  populate_search(args.rows)
+  for term in SEARCH_TERMS:
+    report('ilike "{}"'.format(term), timed(lambda: ilike_page(term), args.repeat))
+    report('full text "{}"'.format(term), timed(lambda: search_page(term), args.repeat))
+
+#----------------------------------------------------------------------------#
+# JSON serialization.
+#----------------------------------------------------------------------------#
+
+def format_page(size):
+  # Question objects, format() and jsonify, as with FAST_JSON off
+  questions = [question.format() for question in Question.query.order_by(Question.id).limit(size)]
+  return jsonify({'success': True, 'questions': questions}).get_data()
+
+def fast_page(size):
+  questions = serializer.select_rows(Question.query.order_by(Question.id).limit(size), Question.format_columns())
+  return serializer.json_response({'success': True, 'questions': questions}).get_data()
+
+def bench_json(args):
+  populate_search(args.page_size)
+  orjson = serializer.orjson
+  paths = [('format() + jsonify', format_page)]
+  if orjson is not None:
+    paths.append(('row tuples + orjson', fast_page))
+  else:
+    print('orjson is not installed, only the standard library encoder is measured')
+  paths.append(('row tuples + json', fast_page))
+
+  for label, page in paths:
+    serializer.orjson = orjson if 'orjson' in label else None
+    timings = timed(lambda: page(args.page_size), args.repeat)
+    report('{} ({} rows)'.format(label, args.page_size), timings)
+    print('{:<45} {:>10.0f} rows/sec'.format('', args.page_size / (statistics.median(timings) / 1000)))
+  serializer.orjson = orjson
+
+#----------------------------------------------------------------------------#
+# Launch.
+#----------------------------------------------------------------------------#
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Trivia API benchmarks')
+  parser.add_argument('--database', default='postgres://localhost:5432/trivia_bench', help='scratch database url')
+  subparsers = parser.add_subparsers(dest='benchmark')
+  subparsers.required = True
+
+  search = subparsers.add_parser('search', help='question search latency, first page plus total')
+  search.add_argument('--rows', type=int, default=1000000, help='synthetic questions')
+  search.add_argument('--repeat', type=int, default=10, help='runs per search term')
+  search.set_defaults(run=bench_search)
+
+  page = subparsers.add_parser('json', help='rows/sec of a question page, ORM and jsonify against the fast path')
+  page.add_argument('--page-size', type=int, default=1000, help='questions on the page')
+  page.add_argument('--repeat', type=int, default=20, help='pages to time')
+  page.set_defaults(run=bench_json)
+
+  args = parser.parse_args()
+  app = Flask(__name__)
+  setup_db(app, args.database)
+  with app.app_context():
+    args.run(args)
@@ -0,0 +1,35 @@
+import hashlib
+import json
+import threading
+
+from models import Category
+
+'''
+CategoryCache
+    keeps the category catalogue of the process in memory. categories are
+    only changed by hand, so they are loaded once when the app is created and
+    again when invalidate() is called; every load bumps `version`.
+    the /categories response body is rendered once per load, with its ETag.
+'''
+class CategoryCache:
+  def __init__(self):
+    self.version = 0
+    self.lock = threading.Lock()
+    self.load()
+
+  def load(self):
+    categories = Category.query.order_by(Category.id).all()
+    formatted = [category.format() for category in categories]
+    names = [category['type'] for category in formatted]
+    # rendered like jsonify does outside debug mode
+    body = (json.dumps({'success': True, 'categories': names}, sort_keys=True) + '\n').encode('utf-8')
+
+    with self.lock:
+      self.formatted = formatted
+      self.names = names
+      self.version += 1
+      # body and ETag are swapped together so a reload never mixes them
+      self.response = (body, '{}-{}'.format(self.version, hashlib.sha1(body).hexdigest()))
+
+  def invalidate(self):
+    self.load()
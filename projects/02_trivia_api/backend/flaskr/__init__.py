@@ -1,16 +1,25 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, Response, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
 
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category, QuestionCount
+from quiz import QuestionSampler, QuizSessionStore
+from categories import CategoryCache
+from serializer import select_rows, json_response
 
 QUESTIONS_PER_PAGE = 10
+QUESTIONS_PER_BATCH = 1000
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  # FAST_JSON serves question pages through serializer.py instead of format() and jsonify,
+  # off unless asked for with create_app({'FAST_JSON': True})
+  app.config.from_mapping(FAST_JSON=False)
+  if test_config is not None:
+    app.config.from_mapping(test_config)
   setup_db(app)
   
   '''
@@ -18,6 +27,14 @@ def create_app(test_config=None):
   '''
   CORS(app)
 
+  # question ids per quiz category and quizzes in progress, see quiz.py
+  sampler = QuestionSampler()
+  quiz_sessions = QuizSessionStore(sampler)
+
+  # categories are read once here, call app.category_cache.invalidate() after changing them
+  with app.app_context():
+    categories = app.category_cache = CategoryCache()
+
   '''
   Use the after_request decorator to set Access-Control-Allow
   '''
@@ -31,15 +48,67 @@ def create_app(test_config=None):
   # Custom Methods:
   #----------------------------------------------------------------------------#
 
-  def paginate_questions(request, selection):
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-
-    questions = [question.format() for question in selection]
-    current_questions = questions[start:end]
-
-    return current_questions
+  def paginate_questions(request, selection, keyset=True):
+    # selection is a query, only the rows of the requested page are loaded.
+    # ?after=<id> continues after the last question id of the previous page,
+    # ?page=<n> is kept for the page links of the frontend.
+    # keyset=False ignores ?after for selections not ordered by id alone.
+    selection = selection.order_by(Question.id)
+    after = request.args.get('after', None, type=int) if keyset else None
+    if after is not None:
+      selection = selection.filter(Question.id > after)
+    else:
+      page = request.args.get('page', 1, type=int)
+      if page < 1:
+        return []
+      selection = selection.offset((page - 1) * QUESTIONS_PER_PAGE)
+
+    selection = selection.limit(QUESTIONS_PER_PAGE)
+    if app.config['FAST_JSON']:
+      return select_rows(selection, Question.format_columns())
+    return [question.format() for question in selection]
+
+  def respond(payload):
+    if app.config['FAST_JSON']:
+      return json_response(payload)
+    return jsonify(payload)
+
+  def count_questions(selection):
+    return selection.order_by(None).count()
+
+  def batch_question(item):
+    # returns (row, None) for a valid question of a batch, (None, error) otherwise
+    if not isinstance(item, dict):
+      return None, 'question must be an object'
+    for field in ('question', 'answer', 'category', 'difficulty'):
+      if not item.get(field):
+        return None, '{} can not be blank'.format(field)
+    try:
+      difficulty = int(item['difficulty'])
+    except (TypeError, ValueError):
+      return None, 'difficulty must be a number'
+    return {
+      'question': item['question'],
+      'answer': item['answer'],
+      'category': str(item['category']),
+      'difficulty': difficulty
+    }, None
+
+  def batch_error(message, results=None):
+    response = {
+      'success': False,
+      'error': 400,
+      'message': message
+    }
+    if results is not None:
+      response['results'] = results
+    return jsonify(response), 400
+
+  def quiz_category_id(category):
+    # the frontend sends category id 0 for "ALL", which is returned as None
+    if category and str(category.get('id', 0)) != '0':
+      return str(category['id'])
+    return None
 
 #----------------------------------------------------------------------------#
 # /categories Endpoints (GET):
@@ -50,16 +119,10 @@ def create_app(test_config=None):
   '''
   @app.route('/categories', methods=['GET'])
   def retrieve_categories():
-    categories = Category.query.order_by(Category.id).all()
-    format_categories = [category.format() for category in categories]
-    category_names = []
-    for category in format_categories:
-      category_names.append(category['type'])
-
-    return jsonify({
-      'success': True,
-      'categories': category_names
-    })
+    body, etag = categories.response
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
   '''
   Create a GET endpoint to get questions based on category. 
@@ -70,16 +133,16 @@ def create_app(test_config=None):
   '''
   @app.route('/categories/<int:category_id>/questions', methods=['GET'])
   def get_questions_by_category(category_id):
-    selection = Question.query.filter(Question.category == category_id).all()
+    selection = Question.query.filter(Question.category == category_id)
     current_questions = paginate_questions(request, selection)
 
     if len(current_questions) == 0:
       abort(404)
     
-    return jsonify({
+    return respond({
       'success': True,
       'questions': current_questions,
-      'total_questions': len(selection),
+      'total_questions': QuestionCount.total(category_id),
       'current_category': category_id
     })
 
@@ -100,24 +163,18 @@ def create_app(test_config=None):
 
   @app.route('/questions', methods=['GET'])
   def retreive_questions():
-    selection = Question.query.order_by(Question.id).all()
+    selection = Question.query
     current_questions = paginate_questions(request, selection)
 
     if len(current_questions) == 0:
       abort(404)
 
-    categories = Category.query.all()
-    format_categories = [category.format() for category in categories]
-    category_names = []
-    for category in format_categories:
-      category_names.append(category['type'])
-
-    return jsonify({
+    return respond({
       'success': True,
       'questions': current_questions,
-      'total_questions': len(selection),
-      'categories': category_names,
-      'current_category': category_names
+      'total_questions': QuestionCount.total(),
+      'categories': categories.names,
+      'current_category': categories.names
     })
 
   '''
@@ -135,6 +192,7 @@ def create_app(test_config=None):
         abort(404)
       
       question.delete()
+      sampler.invalidate()
 
       return jsonify({
         'success': True,
@@ -167,19 +225,19 @@ def create_app(test_config=None):
     
     if search:
       try:
-        selection = Question.query.filter(Question.question.ilike('%{}%'.format(search)))
-        if not selection:
-          abort(404)
-        current_questions = paginate_questions(request, selection)
-
-        categories = Category.query.all()
-        categories_all = [category.format() for category in categories]
-
-        return jsonify({
+        # full text search over question and answer, see Question.search
+        selection = Question.search(search)
+        current_questions = []
+        total_questions = 0
+        if selection is not None:
+          current_questions = paginate_questions(request, selection, keyset=False)
+          total_questions = count_questions(selection)
+
+        return respond({
         'success': True,
         'questions': current_questions,
-        'total_questions': len(current_questions),
-        'current_category': categories_all
+        'total_questions': total_questions,
+        'current_category': categories.formatted
         })
 
       except:
@@ -197,16 +255,86 @@ def create_app(test_config=None):
       try:
         question = Question(question_text, answer_text, category, difficulty)
         question.insert()
+        sampler.invalidate()
         
         return jsonify({
           'success': True,
           'created': question.id,
-          'num_questions': len(Question.query.all())
+          'num_questions': QuestionCount.total()
         })
 
       except:
         abort(422)
 
+  #----------------------------------------------------------------------------#
+  # /questions/batch Endpoints (POST, DELETE):
+  #----------------------------------------------------------------------------#
+
+  '''
+  Bulk create and delete for loading question sets, see load_questions.py.
+  The whole batch is validated first and written in one transaction, so it
+  either succeeds completely or changes nothing. Every response lists one
+  result per item, in the order of the request.
+  '''
+  @app.route('/questions/batch', methods=['POST'])
+  def create_questions_batch():
+    body = request.get_json(silent=True)
+    items = body.get('questions', None) if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+      return batch_error('provide a non-empty list of questions')
+    if len(items) > QUESTIONS_PER_BATCH:
+      return batch_error('send at most {} questions per batch'.format(QUESTIONS_PER_BATCH))
+
+    rows = []
+    results = []
+    for index, item in enumerate(items):
+      row, error = batch_question(item)
+      rows.append(row)
+      results.append({'index': index, 'error': error} if error else {'index': index})
+    if any('error' in result for result in results):
+      return batch_error('invalid questions, nothing was created', results)
+
+    try:
+      ids = Question.insert_many(rows)
+    except:
+      db.session.rollback()
+      abort(422)
+    sampler.invalidate()
+
+    for result, question_id in zip(results, ids):
+      result['id'] = question_id
+    return jsonify({
+      'success': True,
+      'created': ids,
+      'results': results,
+      'total_questions': QuestionCount.total()
+    })
+
+  @app.route('/questions/batch', methods=['DELETE'])
+  def delete_questions_batch():
+    body = request.get_json(silent=True)
+    ids = body.get('ids', None) if isinstance(body, dict) else None
+    if not isinstance(ids, list) or not ids:
+      return batch_error('provide a non-empty list of question ids')
+    if len(ids) > QUESTIONS_PER_BATCH:
+      return batch_error('send at most {} question ids per batch'.format(QUESTIONS_PER_BATCH))
+    if not all(isinstance(question_id, int) and not isinstance(question_id, bool) for question_id in ids):
+      return batch_error('question ids must be integers')
+
+    try:
+      deleted = Question.delete_many(ids)
+    except:
+      db.session.rollback()
+      abort(422)
+    sampler.invalidate()
+
+    return jsonify({
+      'success': True,
+      'deleted': [question_id for question_id in ids if question_id in deleted],
+      'results': [{'id': question_id, 'deleted': question_id in deleted} for question_id in ids],
+      'total_questions': QuestionCount.total()
+    })
+
 #----------------------------------------------------------------------------#
 # /quizzes Endpoint (POST):
 #----------------------------------------------------------------------------#
@@ -226,29 +354,60 @@ def create_app(test_config=None):
       abort(400)
 
     category = body.get('quiz_category', None)
-    previous_questions = body.get('previous_questions', None)
+    previous_questions = body.get('previous_questions', None) or []
 
-    if not previous_questions:
-      if not category:
-        question_options = Question.query.all()
-      else:
-        question_options = Question.query.filter(Question.category == str(category['id'])).all()
-    else:
-      if not category:
-        question_options = Question.query.filter(Question.id.notin_(previous_questions)).all()
-      else:
-        question_options = Question.query.filter(Question.category == str(category['id']), Question.id.notin_(previous_questions)).all()
-    
-    
-    formatted_question = random.choice(question_options).format()
-    # questions_formatted = [question.format() for question in question_options]
-    # random_question = random.choice(questions_formatted)
+    question = sampler.draw(quiz_category_id(category), set(previous_questions))
+    formatted_question = question.format() if question else None
 
     return jsonify({
       'success': True,
       'question': formatted_question
     })
   
+  #----------------------------------------------------------------------------#
+  # /quizzes/sessions Endpoints (POST, DELETE):
+  #----------------------------------------------------------------------------#
+
+  '''
+  Quiz sessions keep the questions still to be asked on the server, so a client
+  only sends its session id for every question instead of previous_questions.
+  A session asks every question of its category once, in random order, and
+  expires after QUIZ_SESSION_TTL seconds without a request.
+  '''
+  @app.route('/quizzes/sessions', methods=['POST'])
+  def create_quiz_session():
+    body = request.get_json(silent=True) or {}
+    session_id, total_questions = quiz_sessions.create(quiz_category_id(body.get('quiz_category', None)))
+
+    return jsonify({
+      'success': True,
+      'session_id': session_id,
+      'total_questions': total_questions
+    })
+
+  @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+  def next_quiz_question(session_id):
+    try:
+      question = quiz_sessions.draw(session_id)
+    except KeyError:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'question': question.format() if question else None,
+      'remaining_questions': quiz_sessions.remaining(session_id)
+    })
+
+  @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+  def end_quiz_session(session_id):
+    if not quiz_sessions.end(session_id):
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'deleted': session_id
+    })
+
   #----------------------------------------------------------------------------#
   # Error Handlers:
   #----------------------------------------------------------------------------#
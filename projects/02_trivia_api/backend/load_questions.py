@@ -0,0 +1,113 @@
+#----------------------------------------------------------------------------#
+# Streams a JSONL file of questions through the /questions/batch endpoints.
+#
+#   python load_questions.py create questions.jsonl
+#   python load_questions.py delete ids.jsonl --url http://127.0.0.1:5000
+#
+# For create, every line is a question object with question, answer, category
+# and difficulty. For delete, every line is a question id or an object with
+# an id. Lines are sent in batches; a batch with an invalid question is
+# rejected as a whole by the API and its errors are printed with line numbers.
+#----------------------------------------------------------------------------#
+
+import argparse
+import json
+import sys
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def read_batches(path, batch_size):
+  # yields lists of (line number, parsed line), skipping blank lines
+  batch = []
+  with open(path, encoding='utf-8') as f:
+    for number, line in enumerate(f, 1):
+      if not line.strip():
+        continue
+      try:
+        batch.append((number, json.loads(line)))
+      except ValueError as e:
+        batch.append((number, e))
+      if len(batch) == batch_size:
+        yield batch
+        batch = []
+  if batch:
+    yield batch
+
+def send(url, method, payload):
+  request = Request(url, data=json.dumps(payload).encode('utf-8'), method=method,
+                    headers={'Content-Type': 'application/json'})
+  try:
+    with urlopen(request) as response:
+      return json.loads(response.read())
+  except HTTPError as e:
+    return json.loads(e.read())
+
+def report(label, numbers, body):
+  # prints the per-item errors of a rejected batch, returns True when it went through
+  if body.get('success'):
+    print('{} lines {}-{}'.format(label, numbers[0], numbers[-1]))
+    return True
+  print('rejected lines {}-{}: {}'.format(numbers[0], numbers[-1], body.get('message')), file=sys.stderr)
+  for result in body.get('results', []):
+    if 'error' in result:
+      print('  line {}: {}'.format(numbers[result['index']], result['error']), file=sys.stderr)
+  return False
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+def create(args):
+  ok = True
+  for batch in read_batches(args.path, args.batch_size):
+    unparsable = [(number, item) for number, item in batch if isinstance(item, ValueError)]
+    if unparsable:
+      for number, error in unparsable:
+        print('line {}: {}'.format(number, error), file=sys.stderr)
+      ok = False
+      continue
+    numbers = [number for number, _ in batch]
+    body = send(args.url + '/questions/batch', 'POST', {'questions': [item for _, item in batch]})
+    ok = report('created', numbers, body) and ok
+  return ok
+
+def delete(args):
+  ok = True
+  for batch in read_batches(args.path, args.batch_size):
+    ids = []
+    for number, item in batch:
+      question_id = item.get('id') if isinstance(item, dict) else item
+      if not isinstance(question_id, int) or isinstance(question_id, bool):
+        print('line {}: not a question id'.format(number), file=sys.stderr)
+        ok = False
+        continue
+      ids.append(question_id)
+    if not ids:
+      continue
+    body = send(args.url + '/questions/batch', 'DELETE', {'ids': ids})
+    if body.get('success'):
+      print('deleted {} of {} questions from lines {}-{}'.format(
+        len(body['deleted']), len(ids), batch[0][0], batch[-1][0]))
+    else:
+      print('rejected lines {}-{}: {}'.format(batch[0][0], batch[-1][0], body.get('message')), file=sys.stderr)
+      ok = False
+  return ok
+
+#----------------------------------------------------------------------------#
+# Launch.
+#----------------------------------------------------------------------------#
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Load or remove trivia questions in bulk')
+  parser.add_argument('command', choices=['create', 'delete'])
+  parser.add_argument('path', help='JSONL file, one question or question id per line')
+  parser.add_argument('--url', default='http://127.0.0.1:5000', help='trivia API base url')
+  parser.add_argument('--batch-size', type=int, default=500, help='lines per request, at most 1000')
+  args = parser.parse_args()
+
+  run = create if args.command == 'create' else delete
+  sys.exit(0 if run(args) else 1)
@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import re
+from sqlalchemy import Column, String, Integer, create_engine, desc, func, literal_column, text
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -18,6 +19,94 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
+    setup_search()
+    setup_counts()
+
+'''
+setup_search()
+    adds the search_vector column behind Question.search, a tsvector of the
+    question and answer that postgres keeps up to date, and its GIN index.
+    the column is generated, so it is not declared on the model.
+    ALTER TABLE locks questions and adding the column rewrites the table, so
+    the DDL only runs when the column or index is missing
+'''
+def setup_search():
+    has_column = db.session.execute(text(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'questions' AND column_name = 'search_vector'")).scalar()
+    if not has_column:
+        db.session.execute(text(
+            "ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', coalesce(question, '') || ' ' || coalesce(answer, ''))) STORED"))
+    has_index = db.session.execute(text(
+        "SELECT 1 FROM pg_indexes "
+        "WHERE schemaname = current_schema() AND tablename = 'questions' AND indexname = 'ix_questions_search_vector'")).scalar()
+    if not has_index:
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_questions_search_vector ON questions USING gin (search_vector)"))
+    db.session.commit()
+
+'''
+setup_counts()
+    installs the triggers that keep question_counts in step with every insert,
+    delete, category change and truncate of questions, and fills the table
+    the first time they are installed. once they are, it only looks them up,
+    without locking questions
+'''
+def setup_counts():
+    if counts_installed():
+        db.session.commit()
+        return
+
+    db.session.execute(text("""
+        CREATE OR REPLACE FUNCTION count_questions() RETURNS trigger AS $$
+        BEGIN
+          IF TG_OP = 'TRUNCATE' THEN
+            DELETE FROM question_counts;
+            RETURN NULL;
+          END IF;
+          IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE question_counts SET count = count - 1 WHERE category = coalesce(OLD.category::text, '');
+          END IF;
+          IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO question_counts (category, count) VALUES (coalesce(NEW.category::text, ''), 1)
+            ON CONFLICT (category) DO UPDATE SET count = question_counts.count + 1;
+          END IF;
+          RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql"""))
+
+    # writers wait while the triggers are installed so the first count is exact.
+    # another process may have installed them before the lock was granted
+    db.session.execute(text('LOCK TABLE questions IN SHARE ROW EXCLUSIVE MODE'))
+    if not counts_installed():
+        db.session.execute(text(
+            'CREATE TRIGGER questions_count AFTER INSERT OR DELETE OR UPDATE OF category ON questions '
+            'FOR EACH ROW EXECUTE PROCEDURE count_questions()'))
+        db.session.execute(text(
+            'CREATE TRIGGER questions_count_truncate AFTER TRUNCATE ON questions '
+            'FOR EACH STATEMENT EXECUTE PROCEDURE count_questions()'))
+        db.session.execute(text('DELETE FROM question_counts'))
+        db.session.execute(text(
+            "INSERT INTO question_counts (category, count) "
+            "SELECT coalesce(category::text, ''), count(*) FROM questions GROUP BY 1"))
+    db.session.commit()
+
+def counts_installed():
+    return db.session.execute(text(
+        "SELECT 1 FROM pg_trigger WHERE tgname = 'questions_count' AND tgrelid = 'questions'::regclass")).scalar() is not None
+
+'''
+search_query(search_term)
+    turns free text into a tsquery matching every word of it, the last one
+    as a prefix so results show up while a word is still being typed.
+    returns None when the search term has no words
+'''
+def search_query(search_term):
+    words = re.findall(r'\w+', search_term)
+    if not words:
+        return None
+    return ' & '.join(words) + ':*'
 
 '''
 Question
@@ -38,9 +127,35 @@ class Question(db.Model):
     self.category = category
     self.difficulty = difficulty
 
+  @staticmethod
+  def search(search_term):
+    '''
+    returns a query over the questions whose question or answer matches
+    search_term, best ranked first, or None when there is nothing to search
+    '''
+    query = search_query(search_term)
+    if query is None:
+      return None
+    tsquery = func.to_tsquery('english', query)
+    document = literal_column('questions.search_vector')
+    return Question.query.filter(document.op('@@')(tsquery)).order_by(desc(func.ts_rank(document, tsquery)))
+
   def insert(self):
     db.session.add(self)
     db.session.commit()
+
+  @staticmethod
+  def insert_many(rows):
+    '''
+    inserts rows, dicts of question, answer, category and difficulty, with
+    one executemany in a single transaction and returns their new ids in order
+    '''
+    ids = [question_id for question_id, in db.session.execute(text(
+      "SELECT nextval(pg_get_serial_sequence('questions', 'id')) FROM generate_series(1, :count)"),
+      {'count': len(rows)})]
+    db.session.execute(Question.__table__.insert(), [dict(row, id=question_id) for row, question_id in zip(rows, ids)])
+    db.session.commit()
+    return ids
   
   def update(self):
     db.session.commit()
@@ -49,6 +164,22 @@ class Question(db.Model):
     db.session.delete(self)
     db.session.commit()
 
+  @staticmethod
+  def delete_many(ids):
+    '''
+    deletes the questions with the given ids in a single transaction and
+    returns the set of ids that existed
+    '''
+    deleted = db.session.execute(text('DELETE FROM questions WHERE id = ANY(:ids) RETURNING id'), {'ids': list(ids)})
+    deleted = {question_id for question_id, in deleted}
+    db.session.commit()
+    return deleted
+
+  @staticmethod
+  def format_columns():
+    # the columns behind format(), for responses that skip building Question objects
+    return [Question.id, Question.question, Question.answer, Question.category, Question.difficulty]
+
   def format(self):
     return {
       'id': self.id,
@@ -75,4 +206,25 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+'''
+QuestionCount
+    number of questions per category, maintained by the triggers from
+    setup_counts() so totals never need a COUNT over questions
+'''
+class QuestionCount(db.Model):
+  __tablename__ = 'question_counts'
+
+  category = Column(String, primary_key=True)
+  count = Column(Integer, nullable=False, default=0)
+
+  @staticmethod
+  def total(category=None):
+    '''
+    returns the number of questions in category, or in all categories
+    '''
+    if category is None:
+      return int(db.session.query(func.coalesce(func.sum(QuestionCount.count), 0)).scalar())
+    count = db.session.query(QuestionCount.count).filter(QuestionCount.category == str(category)).scalar()
+    return count or 0
@@ -0,0 +1,219 @@
+import random
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from models import db, Question
+
+# random picks tried before falling back to scanning the remaining ids
+SAMPLE_ATTEMPTS = 16
+# seconds an idle quiz session is kept, and how many are kept at most
+QUIZ_SESSION_TTL = 30 * 60
+MAX_QUIZ_SESSIONS = 10000
+
+'''
+QuestionSampler
+    keeps the question ids of every quiz category in memory so a random
+    question can be drawn without loading the eligible questions.
+    id arrays are loaded on first use and reloaded after `ttl` seconds or
+    when invalidate() is called after questions are added or deleted.
+'''
+class QuestionSampler:
+  def __init__(self, ttl=60):
+    self.ttl = ttl
+    self.ids = {}
+    self.lock = threading.Lock()
+
+  def load(self, category):
+    query = db.session.query(Question.id).order_by(Question.id)
+    if category is not None:
+      query = query.filter(Question.category == category)
+    return array('q', (question_id for question_id, in query))
+
+  def category_ids(self, category):
+    # category None stands for all categories
+    with self.lock:
+      entry = self.ids.get(category)
+      if entry is None or entry[0] < time.monotonic():
+        entry = (time.monotonic() + self.ttl, self.load(category))
+        self.ids[category] = entry
+      return entry[1]
+
+  def invalidate(self):
+    with self.lock:
+      self.ids.clear()
+
+  def sample(self, category=None, exclude=frozenset()):
+    '''
+    returns a random question id of the category that is not in exclude,
+    or None when every question of the category has been excluded
+    '''
+    ids = self.category_ids(category)
+    if not ids:
+      return None
+
+    # while most of the category is still eligible a random pick almost
+    # always hits, so a quiz step costs the same however big the bank is
+    for _ in range(SAMPLE_ATTEMPTS):
+      question_id = ids[random.randrange(len(ids))]
+      if question_id not in exclude:
+        return question_id
+
+    remaining = [question_id for question_id in ids if question_id not in exclude]
+    return random.choice(remaining) if remaining else None
+
+  def draw(self, category=None, exclude=frozenset()):
+    # returns a random Question, reloading the ids once if the picked
+    # question was deleted by another process since they were loaded
+    for _ in range(2):
+      question_id = self.sample(category, exclude)
+      if question_id is None:
+        return None
+      question = Question.query.get(question_id)
+      if question is not None:
+        return question
+      self.invalidate()
+    return None
+
+
+'''
+Permutation
+    a pseudo-random permutation of range(size) computed one index at a time,
+    so a session does not need a shuffled copy of its question ids.
+    a Feistel network over the smallest even number of bits covering size
+    maps an index to another one, indexes past size are mapped again until
+    they land inside it (at most 4 steps on average). the round keys come
+    from the seed
+'''
+class Permutation:
+  __slots__ = ('size', 'half_bits', 'mask', 'keys')
+
+  ROUNDS = 4
+
+  def __init__(self, size, seed):
+    bits = max(2, (size - 1).bit_length())
+    bits += bits % 2
+    self.size = size
+    self.half_bits = bits // 2
+    self.mask = (1 << self.half_bits) - 1
+    rng = random.Random(seed)
+    self.keys = tuple(rng.getrandbits(64) for _ in range(self.ROUNDS))
+
+  def round(self, half, key):
+    mixed = ((half ^ key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    return (mixed ^ (mixed >> 29)) & self.mask
+
+  def __getitem__(self, index):
+    if not 0 <= index < self.size:
+      raise IndexError(index)
+    while True:
+      left, right = index >> self.half_bits, index & self.mask
+      for key in self.keys:
+        left, right = right, left ^ self.round(right, key)
+      index = (left << self.half_bits) | right
+      if index < self.size:
+        return index
+
+  def __len__(self):
+    return self.size
+
+
+'''
+QuizSession
+    one quiz in progress: the id array of its category as the sampler had it
+    when the session started, a Permutation of its indexes giving the order
+    of the questions and the position of the next question to ask.
+    the sampler replaces id arrays instead of changing them, so sessions of
+    a category share its array and a session costs the same whatever the
+    size of the bank
+'''
+class QuizSession:
+  __slots__ = ('ids', 'order', 'position', 'expires')
+
+  def __init__(self, ids, order, expires):
+    self.ids = ids
+    self.order = order
+    self.position = 0
+    self.expires = expires
+
+  def remaining(self):
+    return len(self.ids) - self.position
+
+
+'''
+QuizSessionStore
+    keeps quiz sessions in memory by session id, least recently used first,
+    so sessions idle for longer than `ttl` are evicted from the front
+'''
+class QuizSessionStore:
+  def __init__(self, sampler, ttl=QUIZ_SESSION_TTL, max_sessions=MAX_QUIZ_SESSIONS):
+    self.sampler = sampler
+    self.ttl = ttl
+    self.max_sessions = max_sessions
+    self.sessions = OrderedDict()
+    self.lock = threading.Lock()
+
+  def evict(self, now):
+    while self.sessions:
+      session_id, session = next(iter(self.sessions.items()))
+      if session.expires >= now and len(self.sessions) <= self.max_sessions:
+        break
+      del self.sessions[session_id]
+
+  def create(self, category=None):
+    # starts a session over the questions of category, returns its id
+    # and the number of questions it will ask
+    ids = self.sampler.category_ids(category)
+    order = Permutation(len(ids), secrets.randbits(64))
+    session_id = secrets.token_urlsafe(16)
+    now = time.monotonic()
+    with self.lock:
+      self.sessions[session_id] = QuizSession(ids, order, now + self.ttl)
+      self.evict(now)
+    return session_id, len(ids)
+
+  def get(self, session_id):
+    now = time.monotonic()
+    with self.lock:
+      self.evict(now)
+      session = self.sessions.get(session_id)
+      if session is not None:
+        session.expires = now + self.ttl
+        self.sessions.move_to_end(session_id)
+      return session
+
+  def next_id(self, session_id):
+    '''
+    returns the next question id of the session, None once it has asked
+    every question. raises KeyError for unknown or expired sessions
+    '''
+    session = self.get(session_id)
+    if session is None:
+      raise KeyError(session_id)
+    with self.lock:
+      if session.position >= len(session.ids):
+        return None
+      question_id = session.ids[session.order[session.position]]
+      session.position += 1
+      return question_id
+
+  def draw(self, session_id):
+    # returns the next Question of the session, skipping questions that
+    # were deleted after the session was created
+    while True:
+      question_id = self.next_id(session_id)
+      if question_id is None:
+        return None
+      question = Question.query.get(question_id)
+      if question is not None:
+        return question
+
+  def remaining(self, session_id):
+    session = self.get(session_id)
+    return session.remaining() if session is not None else 0
+
+  def end(self, session_id):
+    with self.lock:
+      return self.sessions.pop(session_id, None) is not None
@@ -0,0 +1,30 @@
+import json
+
+from flask import Response
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+'''
+Fast JSON path for large responses, switched on with the FAST_JSON config.
+
+select_rows() reads just the columns a response needs as plain row tuples,
+so no model objects are built, and json_response() encodes the payload with
+orjson when it is installed and the standard library otherwise. The output
+has the same keys and values as format() and jsonify.
+'''
+
+def select_rows(selection, columns):
+  # returns the rows of selection as dicts keyed by the names of columns
+  names = [column.key for column in columns]
+  return [dict(zip(names, row)) for row in selection.with_entities(*columns)]
+
+def dumps(payload):
+  if orjson is not None:
+    return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+  return (json.dumps(payload, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+def json_response(payload, status=200):
+  return Response(dumps(payload), status=status, mimetype='application/json')
@@ -5,6 +5,7 @@ from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
 from models import setup_db, Question, Category
+from quiz import Permutation
 from sqlalchemy import desc
 
 #----------------------------------------------------------------------------#
@@ -129,6 +130,30 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data['questions']) > 0)
         self.assertTrue(data['total_questions'] > 0)
 
+    def test_search_question_paginated(self):
+        """Test POST search matches answers and reports the total of every page"""
+        with self.app.app_context():
+            questions = [Question('Search test question {}?'.format(i), 'zanzibarian', '1', 1) for i in range(12)]
+            for question in questions:
+                question.insert()
+            question_ids = [question.id for question in questions]
+
+        try:
+            res = self.client().post('/questions?page=1', json = {'searchTerm' : 'zanzibar'})
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(len(data['questions']), 10)
+            self.assertEqual(data['total_questions'], 12)
+
+            res = self.client().post('/questions?page=2', json = {'searchTerm' : 'zanzibar'})
+            data = json.loads(res.data)
+            self.assertEqual(len(data['questions']), 2)
+            self.assertEqual(data['total_questions'], 12)
+        finally:
+            with self.app.app_context():
+                for question_id in question_ids:
+                    Question.query.get(question_id).delete()
+
     def test_error_404_search_question(self):
         """Test POST to search a question with non existing search term. """
 
@@ -172,6 +197,25 @@ class TriviaTestCase(unittest.TestCase):
 #----------------------------------------------------------------------------#
 # Tests for /categories GET
 #----------------------------------------------------------------------------#
+    def test_get_categories_etag(self):
+        """Test GET categories and revalidating them with their ETag"""
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        with self.app.app_context():
+            self.assertEqual(data['categories'], [category.type for category in Category.query.order_by(Category.id)])
+
+        etag = res.headers['ETag']
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+        with self.app.app_context():
+            self.app.category_cache.invalidate()
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+
     def test_get_all_categories(self):
         """Test GET all categories. """
         # Step 1: Create a category, so test can fetch something
@@ -212,6 +256,33 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertTrue(data['total_questions'] > 0)
     
+    def test_get_questions_after_id(self):
+        """Test GET questions following a question id returns the next page in id order. """
+        res = self.client().get('/questions?page=1')
+        first_page = json.loads(res.data)
+        last_id = first_page['questions'][-1]['id']
+
+        res = self.client().get('/questions?after={}'.format(last_id))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertTrue(all(question['id'] > last_id for question in data['questions']))
+        self.assertEqual(data['total_questions'], first_page['total_questions'])
+        self.assertEqual(data['total_questions'], Question.query.count())
+
+    def test_get_questions_fast_json_matches_format(self):
+        """Test the FAST_JSON question pages match the ones built with format() and jsonify"""
+        fast_app = create_app({'FAST_JSON': True})
+        setup_db(fast_app, self.database_path)
+
+        for url in ['/questions?page=1', '/categories/1/questions']:
+            fast = fast_app.test_client().get(url)
+            slow = self.client().get(url)
+            self.assertEqual(fast.status_code, 200)
+            self.assertEqual(fast.content_type, slow.content_type)
+            self.assertEqual(json.loads(fast.data), json.loads(slow.data))
+
     def test_error_405_get_all_questions_paginated(self):
         """Test wrong method to get all questions from all categories """
         res = self.client().patch('/questions')
@@ -263,6 +334,28 @@ class TriviaTestCase(unittest.TestCase):
 # Tests for /questions DELETE
 #----------------------------------------------------------------------------#
 
+    def test_question_totals_follow_create_and_delete(self):
+        """Test the maintained question totals after POST and DELETE /questions"""
+        with self.app.app_context():
+            total = Question.query.count()
+            category_total = Question.query.filter(Question.category == '2').count()
+
+        res = self.client().post('/questions', json = {
+            'question' : 'How many questions are there?',
+            'answer' : 'One more than before',
+            'category' : '2',
+            'difficulty' : 1
+        })
+        data = json.loads(res.data)
+        question_id = data['created']
+        self.assertEqual(data['num_questions'], total + 1)
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], total + 1)
+        self.assertEqual(json.loads(self.client().get('/categories/2/questions').data)['total_questions'], category_total + 1)
+
+        self.client().delete('/questions/{}'.format(question_id))
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], total)
+        self.assertEqual(json.loads(self.client().get('/categories/2/questions').data)['total_questions'], category_total)
+
     def test_delete_question(self):
         """Test DELETE /question """
         # First, create a new question so it can later be deleted
@@ -297,6 +390,58 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Question with id {} does not exist.'.format(1234567879))
 
+#----------------------------------------------------------------------------#
+# Tests for /questions/batch POST and DELETE
+#----------------------------------------------------------------------------#
+
+    def test_questions_batch(self):
+        """Test creating and deleting questions in bulk"""
+        questions = [{
+            'question' : 'Batch question {}?'.format(i),
+            'answer' : 'Batch answer',
+            'category' : '3',
+            'difficulty' : 2
+        } for i in range(5)]
+
+        res = self.client().post('/questions/batch', json = {'questions' : questions})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['created']), 5)
+        self.assertEqual([result['index'] for result in data['results']], list(range(5)))
+        with self.app.app_context():
+            for question_id, question in zip(data['created'], questions):
+                self.assertEqual(Question.query.get(question_id).question, question['question'])
+
+        ids = data['created'] + [1234567879]
+        res = self.client().delete('/questions/batch', json = {'ids' : ids})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], ids[:5])
+        self.assertEqual(data['results'][-1], {'id' : 1234567879, 'deleted' : False})
+        with self.app.app_context():
+            self.assertEqual(Question.query.filter(Question.id.in_(ids)).count(), 0)
+
+    def test_error_400_questions_batch_invalid_item(self):
+        """Test a batch with one invalid question creates nothing"""
+        with self.app.app_context():
+            total = Question.query.count()
+        questions = [
+            {'question' : 'Valid?', 'answer' : 'Yes', 'category' : '1', 'difficulty' : 1},
+            {'question' : 'Missing answer?', 'category' : '1', 'difficulty' : 1}
+        ]
+
+        res = self.client().post('/questions/batch', json = {'questions' : questions})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['results'], [{'index' : 0}, {'index' : 1, 'error' : 'answer can not be blank'}])
+        with self.app.app_context():
+            self.assertEqual(Question.query.count(), total)
+
 #----------------------------------------------------------------------------#
 # Tests for /quizzes POST
 #----------------------------------------------------------------------------#
@@ -332,6 +477,40 @@ class TriviaTestCase(unittest.TestCase):
         # Also check if returned question is NOT in previous question
         self.assertTrue(data['question']['id'] not in json_play_quizz['previous_questions'])
 
+    def test_play_quiz_all_categories(self):
+        """Test /quizzes with the "ALL" category the frontend sends as id 0"""
+        json_play_quizz = {
+            'previous_questions' : [],
+            'quiz_category' : {
+                'type' : 'click',
+                'id' : 0
+                }
+        }
+        res = self.client().post('/quizzes', json = json_play_quizz)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertTrue(data['question']['question'])
+
+    def test_play_quiz_category_exhausted(self):
+        """Test /quizzes ends the quiz once every question of the category was asked"""
+        with self.app.app_context():
+            question_ids = [question.id for question in Question.query.filter(Question.category == '1')]
+        json_play_quizz = {
+            'previous_questions' : question_ids,
+            'quiz_category' : {
+                'type' : 'Science',
+                'id' : '1'
+                }
+        }
+        res = self.client().post('/quizzes', json = json_play_quizz)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['question'], None)
+
     def test_error_400_play_quiz(self):
         """Test /quizzes error without any JSON Body"""
         res = self.client().post('/quizzes')
@@ -352,6 +531,61 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'method not allowed')
 
+#----------------------------------------------------------------------------#
+# Tests for /quizzes/sessions
+#----------------------------------------------------------------------------#
+    def test_quiz_session(self):
+        """Test a quiz session asks every question of its category once"""
+        res = self.client().post('/quizzes/sessions', json = {'quiz_category' : {'type' : 'Science', 'id' : '1'}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        session_id = data['session_id']
+        with self.app.app_context():
+            question_ids = [question.id for question in Question.query.filter(Question.category == '1')]
+        self.assertEqual(data['total_questions'], len(question_ids))
+
+        asked = []
+        for remaining in reversed(range(len(question_ids))):
+            res = self.client().post('/quizzes/sessions/{}/next'.format(session_id))
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['remaining_questions'], remaining)
+            asked.append(data['question']['id'])
+        self.assertEqual(sorted(asked), sorted(question_ids))
+
+        res = self.client().post('/quizzes/sessions/{}/next'.format(session_id))
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question'], None)
+
+        res = self.client().delete('/quizzes/sessions/{}'.format(session_id))
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], session_id)
+
+    def test_quiz_session_permutation(self):
+        """Test the order of a quiz session visits every index once"""
+        for size in [0, 1, 2, 17, 1000]:
+            order = Permutation(size, seed=size)
+            self.assertEqual(sorted(order[index] for index in range(size)), list(range(size)))
+
+    def test_404_quiz_session_ended(self):
+        """Test drawing from an ended quiz session"""
+        res = self.client().post('/quizzes/sessions', json = {})
+        session_id = json.loads(res.data)['session_id']
+        self.client().delete('/quizzes/sessions/{}'.format(session_id))
+
+        res = self.client().post('/quizzes/sessions/{}/next'.format(session_id))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+        res = self.client().delete('/quizzes/sessions/{}'.format(session_id))
+        self.assertEqual(res.status_code, 404)
+
 # Make the tests conveniently executable.
 # From backend directory, run 'python test_flaskr.py' to start tests
 if __name__ == "__main__":
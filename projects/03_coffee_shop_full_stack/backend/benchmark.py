@@ -0,0 +1,388 @@
+#----------------------------------------------------------------------------#
+# Benchmarks for the coffee shop auth layer.
+#
+# Everything runs offline: tokens are minted and verified with a local RSA
+# keypair (see src/auth/keys.py) instead of the Auth0 tenant, e.g.
+#
+#   python benchmark.py auth --requests 2000
+#   python benchmark.py permissions --scopes 100 500
+#   python benchmark.py load --requests 20000 --concurrency 4
+#   python benchmark.py concurrency --workers 4
+#   python benchmark.py drinks --drinks 1000 10000 50000
+#----------------------------------------------------------------------------#
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+from flask import Flask
+
+from src.auth import auth
+from src.auth.permissions import Requirement, scopes_of
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def timed(fn, repeat):
+    # returns the wall clock time of each call in microseconds
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000000)
+    return timings
+
+def report(label, timings):
+    p95 = sorted(timings)[max(0, int(len(timings) * 0.95) - 1)]
+    print('{:<45} median {:>9.1f} us   p95 {:>9.1f} us   {:>9.0f} req/s'.format(
+        label, statistics.median(timings), p95, 1000000 / statistics.median(timings)))
+
+#----------------------------------------------------------------------------#
+# Auth.
+#----------------------------------------------------------------------------#
+
+def bench_auth(args):
+    app = Flask(__name__)
+
+    def unprotected():
+        return None
+
+    @auth.requires_auth('patch:drinks')
+    def endpoint(payload):
+        return payload
+
+    keys = auth.use_local_keys('benchmark')
+    token = keys.mint(['get:drinks-detail', 'patch:drinks', 'post:drinks'])
+    headers = {'Authorization': 'Bearer ' + token}
+
+    def request(view=endpoint):
+        with app.test_request_context('/drinks/1', method='PATCH', headers=headers):
+            view()
+
+    report('no auth (request context only)', timed(lambda: request(unprotected), args.requests))
+    request()
+    cache_size = auth.token_cache.max_entries
+    for label, size in [('verify every request', 0), ('verified token cache', cache_size)]:
+        auth.token_cache.clear()
+        auth.token_cache.max_entries = size
+        report(label, timed(request, args.requests))
+    auth.token_cache.max_entries = cache_size
+
+#----------------------------------------------------------------------------#
+# Permissions.
+#----------------------------------------------------------------------------#
+
+def bench_permissions(args):
+    batch = 100
+
+    def per_check(check):
+        # times batches of checks and reports the time of one
+        def run():
+            for _ in range(batch):
+                check()
+        return [timing / batch for timing in timed(run, args.repeat)]
+
+    for count in args.scopes:
+        # the required permission sorts last, the worst case for a list scan
+        permissions = ['read:resource-{:04d}'.format(i) for i in range(count - 1)] + ['zz:drinks']
+        payload = {'permissions': permissions}
+        scopes = scopes_of(payload)
+        exact = Requirement(all_of=['zz:drinks'])
+        any_of = Requirement(any_of=['delete:drinks', 'patch:drinks', 'zz:drinks'])
+        wildcard = Requirement(all_of=['*:drinks'])
+
+        print('{} scopes per token'.format(count))
+        report('  list scan (previous check_permissions)', per_check(lambda: 'zz:drinks' in payload['permissions']))
+        report('  frozenset built per check', per_check(lambda: exact.satisfied_by(scopes_of(payload))))
+        report('  cached frozenset, exact', per_check(lambda: exact.satisfied_by(scopes)))
+        report('  cached frozenset, any of 3', per_check(lambda: any_of.satisfied_by(scopes)))
+        report('  wildcard *:drinks, new token', per_check(lambda: wildcard.match(scopes)))
+        report('  wildcard *:drinks, repeated token', per_check(lambda: wildcard.satisfied_by(scopes)))
+
+#----------------------------------------------------------------------------#
+# Load.
+#----------------------------------------------------------------------------#
+
+LOAD_PERMISSIONS = ['get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks']
+LOAD_RECIPE = [{'name': 'milk', 'color': 'white', 'parts': 3}, {'name': 'espresso', 'color': 'brown', 'parts': 1}]
+
+def load_rounds(client, tokens, rounds, worker):
+    # drives `rounds` rounds through one test client, one round is the life of
+    # a drink plus two reads, five requests. returns (timings by route, errors)
+    timings = defaultdict(list)
+    errors = 0
+
+    def call(label, method, path, token, body=None):
+        nonlocal errors
+        start = time.perf_counter()
+        res = client.open(path, method=method, json=body, headers={'Authorization': token})
+        timings[label].append((time.perf_counter() - start) * 1000000)
+        if res.status_code != 200:
+            errors += 1
+        return res
+
+    for i in range(rounds):
+        token = tokens[(worker + i) % len(tokens)]
+        title = 'load {}-{}'.format(worker, i)
+        res = call('POST /drinks', 'POST', '/drinks', token, {'title': title, 'recipe': LOAD_RECIPE})
+        drink_id = res.get_json()['drinks']['id'] if res.status_code == 200 else 0
+        call('PATCH /drinks/<id>', 'PATCH', '/drinks/{}'.format(drink_id), token, {'title': title + ' v2'})
+        call('GET /drinks', 'GET', '/drinks', token)
+        call('GET /drinks-detail', 'GET', '/drinks-detail', token)
+        call('DELETE /drinks/<id>', 'DELETE', '/drinks/{}'.format(drink_id), token)
+    return dict(timings), errors
+
+def load_worker(url, private_key, tokens, rounds, worker, ready, start, results):
+    # one worker process of a multi-worker server, with its own app, pool,
+    # token cache and client, verifying tokens with the shared keypair
+    os.environ['DATABASE_URL'] = url
+    from src import api
+    auth.use_local_keys('load', private_key)
+    client = api.app.test_client()
+    ready.set()
+    start.wait()
+    results.put(load_rounds(client, tokens, rounds, worker))
+
+def bench_load(args):
+    # the api binds its database on import, so it is imported once DATABASE_URL
+    # points at a scratch database
+    directory = tempfile.mkdtemp()
+    url = 'sqlite:///{}'.format(os.path.join(directory, 'load.db'))
+    os.environ['DATABASE_URL'] = url
+    from src import api
+    from src.database.models import db, Drink
+
+    keys = auth.use_local_keys('load')
+    # more distinct tokens than the token cache holds makes every request verify its token
+    tokens = ['Bearer ' + keys.mint(LOAD_PERMISSIONS, subject='auth0|load-{}'.format(i)) for i in range(args.tokens)]
+
+    with api.app.app_context():
+        db.create_all()
+        for i in range(args.drinks):
+            Drink(title='seed {}'.format(i), recipe=json.dumps(LOAD_RECIPE)).insert()
+
+    # the rounds are split between the workers, each with its own client
+    rounds = [max(1, args.requests // 5 // args.concurrency)] * args.concurrency
+    started = time.perf_counter()
+    if args.mode == 'processes' and args.concurrency > 1:
+        context = multiprocessing.get_context('spawn')
+        start = context.Event()
+        results = context.Queue()
+        workers = []
+        for worker in range(args.concurrency):
+            ready = context.Event()
+            process = context.Process(target=load_worker,
+                                      args=(url, keys.private_key, tokens, rounds[worker], worker, ready, start, results))
+            process.start()
+            ready.wait()
+            workers.append(process)
+        started = time.perf_counter()
+        start.set()
+        outcomes = [results.get() for _ in workers]
+        elapsed = time.perf_counter() - started
+        for process in workers:
+            process.join()
+    else:
+        threads = []
+        outcomes = [None] * args.concurrency
+
+        def run(worker):
+            outcomes[worker] = load_rounds(api.app.test_client(), tokens, rounds[worker], worker)
+
+        for worker in range(args.concurrency):
+            threads.append(threading.Thread(target=run, args=(worker,)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    timings = defaultdict(list)
+    errors = 0
+    for worker_timings, worker_errors in outcomes:
+        for label, route_timings in worker_timings.items():
+            timings[label].extend(route_timings)
+        errors += worker_errors
+    requests = sum(rounds) * 5
+
+    for label, route_timings in timings.items():
+        report(label, route_timings)
+    print('{} requests in {:.1f} s, {:.0f} req/s combined over {} {}, {} errors, {} tokens, {} drinks'.format(
+        requests, elapsed, requests / elapsed, args.concurrency,
+        args.mode if args.concurrency > 1 else 'client', errors, len(tokens), args.drinks))
+    shutil.rmtree(directory)
+
+#----------------------------------------------------------------------------#
+# Concurrency.
+#----------------------------------------------------------------------------#
+
+def sqlite_worker(url, profile, seconds, write_ratio, ready, start, results):
+    # one worker process of a multi-worker server, with its own engine and pool
+    os.environ['DATABASE_URL'] = url
+    from sqlalchemy import exc
+    from src.database.models import db, setup_db, Drink
+
+    app = Flask(__name__)
+    setup_db(app, profile)
+    recipe = json.dumps([{'name': 'milk', 'color': 'white', 'parts': 1}])
+    reads = writes = locked = 0
+    with app.app_context():
+        if results is None:
+            db.create_all()
+            return
+        ready.set()
+        start.wait()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            try:
+                if random.random() < write_ratio:
+                    Drink.create('{}-{}'.format(os.getpid(), writes), recipe)
+                    writes += 1
+                else:
+                    [drink.short_json() for drink in Drink.query.order_by(Drink.id.desc()).limit(50)]
+                    reads += 1
+            except exc.OperationalError:
+                # database is locked
+                db.session.rollback()
+                locked += 1
+    results.put((reads, writes, locked))
+
+def bench_concurrency(args):
+    # spawned workers import the models with their own DATABASE_URL
+    context = multiprocessing.get_context('spawn')
+    for profile in args.profiles:
+        directory = tempfile.mkdtemp()
+        url = 'sqlite:///{}'.format(os.path.join(directory, 'concurrency.db'))
+        setup = context.Process(target=sqlite_worker, args=(url, profile, 0, 0, None, None, None))
+        setup.start()
+        setup.join()
+
+        start = context.Event()
+        results = context.Queue()
+        workers = []
+        for _ in range(args.workers):
+            ready = context.Event()
+            worker = context.Process(target=sqlite_worker,
+                                     args=(url, profile, args.seconds, args.writes, ready, start, results))
+            worker.start()
+            ready.wait()
+            workers.append(worker)
+        start.set()
+        totals = [sum(counts) for counts in zip(*[results.get() for _ in workers])]
+        for worker in workers:
+            worker.join()
+
+        reads, writes, locked = totals
+        print('{:<8} {} workers   reads {:>8.0f}/s   writes {:>7.0f}/s   database is locked {:>6}'.format(
+            profile, args.workers, reads / args.seconds, writes / args.seconds, locked))
+        shutil.rmtree(directory)
+
+#----------------------------------------------------------------------------#
+# Drinks.
+#----------------------------------------------------------------------------#
+
+def bench_drinks(args):
+    # the api binds its database on import, see bench_load
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///{}'.format(os.path.join(directory, 'drinks.db'))
+    from src import api
+    from src.database.models import db, Drink, encode_recipe
+
+    # the original GET /drinks, every Drink and its parsed recipe in memory before jsonify
+    @api.app.route('/drinks-buffered')
+    def drinks_buffered():
+        return api.jsonify({'success': True, 'drinks': [{
+            'id': drink.id,
+            'title': drink.title,
+            'recipe': [{'color': r['color'], 'parts': r['parts']} for r in json.loads(drink.recipe)]
+        } for drink in Drink.query.all()]})
+
+    client = api.app.test_client()
+
+    def get(path):
+        # returns the seconds to the first chunk and to the end, and the body size
+        start = time.perf_counter()
+        res = client.get(path, buffered=False)
+        body = iter(res.response)
+        size = len(next(body))
+        first_byte = time.perf_counter() - start
+        size += sum(len(chunk) for chunk in body)
+        res.close()
+        return first_byte, time.perf_counter() - start, size
+
+    recipe = json.dumps([{'name': 'milk', 'color': 'white', 'parts': 3}, {'name': 'espresso', 'color': 'brown', 'parts': 1}])
+    with api.app.app_context():
+        db.create_all()
+
+    count = 0
+    for target in sorted(args.drinks):
+        with api.app.app_context():
+            short_recipe, long_recipe = encode_recipe(recipe)
+            db.session.execute(Drink.__table__.insert(), [
+                {'title': 'drink {}'.format(i), 'recipe': recipe, 'short_recipe': short_recipe, 'long_recipe': long_recipe}
+                for i in range(count, target)])
+            db.session.commit()
+        count = target
+
+        print('{} drinks'.format(count))
+        for label, path in [('buffered', '/drinks-buffered'), ('streamed', '/drinks')]:
+            first_byte, total, size = get(path)
+            # memory is traced in a second request, tracing slows the first down
+            tracemalloc.start()
+            get(path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('  {:<10} first byte {:>8.1f} ms   total {:>8.1f} ms   peak memory {:>7.1f} MiB   {:>6.1f} MiB body'.format(
+                label, first_byte * 1000, total * 1000, peak / 2 ** 20, size / 2 ** 20))
+    shutil.rmtree(directory)
+
+#----------------------------------------------------------------------------#
+# Launch.
+#----------------------------------------------------------------------------#
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Coffee shop benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+
+    requires_auth = subparsers.add_parser('auth', help='requires_auth overhead per request')
+    requires_auth.add_argument('--requests', type=int, default=2000, help='requests to time')
+    requires_auth.set_defaults(run=bench_auth)
+
+    permissions = subparsers.add_parser('permissions', help='permission checks for tokens with many scopes')
+    permissions.add_argument('--scopes', type=int, nargs='+', default=[100, 500], help='scopes per token')
+    permissions.add_argument('--repeat', type=int, default=200, help='batches of 100 checks to time')
+    permissions.set_defaults(run=bench_permissions)
+
+    load = subparsers.add_parser('load', help='authenticated drink routes end to end, no network')
+    load.add_argument('--requests', type=int, default=10000, help='requests to send')
+    load.add_argument('--tokens', type=int, default=1, help='distinct tokens to cycle through')
+    load.add_argument('--drinks', type=int, default=20, help='drinks in the database besides the ones created')
+    load.add_argument('--concurrency', type=int, default=1, help='workers sending requests at the same time')
+    load.add_argument('--mode', choices=['processes', 'threads'], default='processes',
+                      help='run the workers as processes, like a multi-worker server, or as threads of one')
+    load.set_defaults(run=bench_load)
+
+    concurrency = subparsers.add_parser('concurrency', help='SQLite reads/writes per second across worker processes')
+    concurrency.add_argument('--workers', type=int, default=4, help='worker processes')
+    concurrency.add_argument('--seconds', type=float, default=5, help='seconds each profile runs')
+    concurrency.add_argument('--writes', type=float, default=0.2, help='share of operations that write')
+    concurrency.add_argument('--profiles', nargs='+', default=['default', 'tuned'], help='SQLite profiles to compare')
+    concurrency.set_defaults(run=bench_concurrency)
+
+    drinks = subparsers.add_parser('drinks', help='GET /drinks first byte, time and memory by catalogue size')
+    drinks.add_argument('--drinks', type=int, nargs='+', default=[1000, 10000, 50000], help='catalogue sizes')
+    drinks.set_defaults(run=bench_drinks)
+
+    args = parser.parse_args()
+    args.run(args)
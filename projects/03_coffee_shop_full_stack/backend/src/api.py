@@ -1,10 +1,10 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, Response, request, jsonify, abort, stream_with_context
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db_drop_and_create_all, setup_db, Drink, DrinkConflict
 from .auth.auth import AuthError, requires_auth
 
 app = Flask(__name__)
@@ -18,6 +18,42 @@ Uncomment the following line to initialize the datbase
 '''
 #db_drop_and_create_all()
 
+# pre-encoded drinks sent per chunk of a streamed response
+DRINKS_PER_CHUNK = 500
+
+'''
+drinks_response(drinks)
+    streams pre-encoded drinks (see Drink.iter_json) as the same body
+    jsonify({'success': True, 'drinks': [...]}) would build, a chunk of
+    DRINKS_PER_CHUNK drinks at a time
+    the first drink is read before the response starts, so a failing query
+    still ends in a 500. once the 200 has been sent an error can no longer
+    change it: the error is logged and re-raised, so the server drops the
+    connection and the client gets a cut off body (with chunked transfer,
+    one missing its last chunk) rather than a complete, wrong one
+'''
+def drinks_response(drinks):
+    drinks = iter(drinks)
+    first = next(drinks, None)
+
+    def generate():
+        chunk = [b'{"drinks":[']
+        if first is not None:
+            chunk.append(first)
+        try:
+            for drink in drinks:
+                if len(chunk) >= DRINKS_PER_CHUNK:
+                    yield b''.join(chunk)
+                    chunk = []
+                chunk.append(b',' + drink)
+        except Exception:
+            app.logger.exception('GET drinks failed after the response started, the body is cut off')
+            raise
+        chunk.append(b'],"success":true}\n')
+        yield b''.join(chunk)
+
+    return Response(stream_with_context(generate()), status=200, mimetype='application/json')
+
 ## ROUTES
 '''
 GET /drinks
@@ -25,14 +61,12 @@ GET /drinks
         it should contain only the drink.short() data representation
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
+        the body is streamed, an error after the first drink cuts it off (see drinks_response)
 '''
 @app.route('/drinks', methods=['GET'])
 def drinks():
     try:
-        return jsonify({
-            'success': True,
-            'drinks': [drink.short() for drink in Drink.query.all()]
-        }), 200
+        return drinks_response(Drink.iter_json('short'))
     except:
         abort(500)
 
@@ -44,6 +78,7 @@ POST /drinks
         it should contain the drink.long() data representation
     returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the newly created drink
         or appropriate status code indicating reason for failure
+        409 if a drink with the title exists, 422 if the recipe is malformed
 '''
 
 @app.route('/drinks', methods=['POST'])
@@ -63,16 +98,54 @@ def create_drink(f):
         abort(400)
 
     try:
-        drink = Drink(title, recipe)
-        drink.insert()
+        drink = Drink.create(title, recipe)
+    except DrinkConflict:
+        abort(409)
+    except ValueError:
+        abort(422)
+    except:
+        abort(500)
+
+    return jsonify({
+        'success': True,
+        'drinks': drink.long()
+    }), 200
+
+'''
+PUT /drinks
+        it should create the drink with the given title, or replace its recipe if it exists
+        it should require the 'post:drinks' and 'patch:drinks' permissions
+        it should contain the drink.long() data representation
+    returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the drink
+        or appropriate status code indicating reason for failure
+        422 if the recipe is malformed
+'''
+@app.route('/drinks', methods=['PUT'])
+@requires_auth(all_of=['post:drinks', 'patch:drinks'])
+def upsert_drink(f):
+    body = request.get_json()
+    if not body:
+        abort(400)
+
+    title = body.get('title', None)
+    recipe = body.get('recipe', None)
+    if not title or not recipe:
+        abort(400)
+    if type(recipe) != str:
+        recipe = json.dumps(recipe)
 
-        return jsonify({
-            'success': True,
-            'drinks': drink.long()
-        }), 200
+    try:
+        drink = Drink.upsert(title, recipe)
+    except ValueError:
+        abort(422)
     except:
         abort(500)
 
+    return jsonify({
+        'success': True,
+        'drinks': [drink.long()]
+    }), 200
+
 '''
 PATCH /drinks/<id>
         where <id> is the existing model id
@@ -82,6 +155,7 @@ PATCH /drinks/<id>
         it should contain the drink.long() data representation
     returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the updated drink
         or appropriate status code indicating reason for failure
+        409 if another drink has the new title, 422 if the recipe is malformed
 '''
 
 @app.route('/drinks/<int:drink_id>', methods=['PATCH'])
@@ -91,23 +165,27 @@ def update_drink(f, drink_id):
     if not body:
         abort(400)
 
-    try:
-        drink = Drink.query.filter(Drink.id == drink_id).one_or_none()
-        if drink:
-            drink.title = body.get('title') if body.get('title') else drink.title
-            recipe = body.get('recipe') if body.get('recipe') else drink.recipe
-            drink.recipe = recipe if type(recipe) == str else json.dumps(recipe)
+    title = body.get('title') or None
+    recipe = body.get('recipe') or None
+    if recipe is not None and type(recipe) != str:
+        recipe = json.dumps(recipe)
 
-            drink.update()
-            return jsonify({
-                'success': True,
-                'drinks': [drink.long()]
-            }), 200
-        else:
-            abort(404)
+    try:
+        drink = Drink.patch(drink_id, title, recipe)
+    except DrinkConflict:
+        abort(409)
+    except ValueError:
+        abort(422)
     except:
         abort(500)
 
+    if drink is None:
+        abort(404)
+    return jsonify({
+        'success': True,
+        'drinks': [drink.long()]
+    }), 200
+
 '''
 DELETE /drinks/<id>
         where <id> is the existing model id
@@ -140,15 +218,13 @@ GET /drinks-detail
         it should contain the drink.long() data representation
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
+        the body is streamed, an error after the first drink cuts it off (see drinks_response)
 '''
 @app.route('/drinks-detail', methods=['GET'])
 @requires_auth('get:drinks-detail')
 def drinks_detail(f):
     try:
-        return jsonify({
-            'success': True,
-            'drinks': [drink.long() for drink in Drink.query.all()]
-        }), 200
+        return drinks_response(Drink.iter_json('long'))
     except:
         abort(500)
 
@@ -191,6 +267,15 @@ def not_found(error):
         }), 404
 
 
+@app.errorhandler(409)
+def conflict(error):
+    return jsonify({
+        "success": False, 
+        "error": 409,
+        "message": "Conflict"
+        }), 409
+
+
 @app.errorhandler(422)
 def unprocessable(error):
     return jsonify({
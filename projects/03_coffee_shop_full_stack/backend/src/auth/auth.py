@@ -1,13 +1,41 @@
 import json
+import os
 from flask import request, _request_ctx_stack, abort
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import JWKSKeyStore
+from .keys import LocalKeyProvider
+from .permissions import Requirement, scopes_of
+from .tokens import VerifiedTokenCache
 
 
 AUTH0_DOMAIN = 'max-fsnd.us.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'coffee'
+ISSUER = f'https://{AUTH0_DOMAIN}/'
+# JWKS_URL overrides where the signing keys are read from, e.g. a file:// url in tests
+JWKS_URL = os.environ.get('JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+# any KeyProvider (see keys.py), use_local_keys() swaps in a local keypair
+key_store = JWKSKeyStore(JWKS_URL)
+# payloads of tokens verified before, see tokens.py
+token_cache = VerifiedTokenCache(int(os.environ.get('TOKEN_CACHE_SIZE', 1024)))
+
+'''
+use_local_keys(kid, private_key)
+    verifies tokens against a local keypair instead of the Auth0 tenant and
+    returns its LocalKeyProvider, whose mint() signs tokens with any
+    permissions. the keypair is freshly generated unless the PEM of
+    private_key is given, i.e. to share one between load test processes.
+    meant for tests and load tests
+'''
+def use_local_keys(kid='local', private_key=None):
+    global key_store
+    key_store.stop()
+    key_store = LocalKeyProvider(ISSUER, API_AUDIENCE, kid=kid, private_key=private_key)
+    token_cache.clear()
+    return key_store
 
 ## AuthError Exception
 '''
@@ -66,19 +94,24 @@ def get_token_auth_header():
 '''
 Implement check_permissions(permission, payload) method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink') or a Requirement (see permissions.py)
         payload: decoded jwt payload
+        scopes: the payload's permissions as a frozenset, built from payload if not given
 
     it should raise an AuthError if permissions are not included in the payload
         !!NOTE check your RBAC settings in Auth0
     it should raise an AuthError if the requested permission string is not in the payload permissions array
     return true otherwise
 '''
-def check_permissions(permission, payload):
-    if 'permissions' not in payload:
+def check_permissions(permission, payload, scopes=None):
+    if scopes is None:
+        scopes = scopes_of(payload)
+    if scopes is None:
         abort(400)
 
-    if permission not in payload['permissions']:
+    if not isinstance(permission, Requirement):
+        permission = Requirement(all_of=[permission])
+    if not permission.satisfied_by(scopes):
         abort(401)
     return True
 
@@ -89,15 +122,37 @@ Implement verify_decode_jwt(token) method
 
     it should be an Auth0 token with key id (kid)
     it should verify the token using Auth0 /.well-known/jwks.json
+        the keys come from key_store, which caches and refreshes them (see jwks.py)
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
+        payloads are cached in token_cache until the token expires (see verify_token)
 
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+    return verify_token(token)[0]
+
+'''
+verify_token(token)
+    returns the payload of token and the frozenset of its scopes, from
+    token_cache or else by verifying it with decode_jwt
+'''
+def verify_token(token):
+    entry = token_cache.lookup(token)
+    if entry is not None:
+        return entry
+
+    payload = decode_jwt(token)
+    scopes = scopes_of(payload)
+    token_cache.set(token, payload, scopes)
+    return payload, scopes
+
+'''
+decode_jwt(token)
+    verifies and decodes token with the key of its kid, no caching
+'''
+def decode_jwt(token):
     unverified_header = jwt.get_unverified_header(token)
     rsa_key = {}
     if 'kid' not in unverified_header:
@@ -106,15 +161,15 @@ def verify_decode_jwt(token):
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    key = key_store.get(unverified_header['kid'])
+    if key:
+        rsa_key = {
+            'kty': key['kty'],
+            'kid': key['kid'],
+            'use': key['use'],
+            'n': key['n'],
+            'e': key['e']
+        }
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -122,7 +177,7 @@ def verify_decode_jwt(token):
                 rsa_key,
                 algorithms=ALGORITHMS,
                 audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
+                issuer=ISSUER
             )
 
             return payload
@@ -152,22 +207,30 @@ def verify_decode_jwt(token):
 Implement @requires_auth(permission) decorator method
     @INPUTS
         permission: string permission (i.e. 'post:drink')
+        any_of: the token needs at least one of these permissions
+        all_of: the token needs every one of these permissions
+            permissions may be wildcards, i.e. '*:drinks' (see permissions.py)
+            with none of them given any valid token with a permissions claim passes
 
     it should use the get_token_auth_header method to get the token
     it should use the verify_decode_jwt method to decode the jwt
+        verify_token, which also returns the token's scopes
     it should use the check_permissions method validate claims and check the requested permission
+        the requirement is compiled once, here, not on every request
     return the decorator which passes the decoded payload to the decorated method
 '''
-def requires_auth(permission=''):
+def requires_auth(permission='', any_of=(), all_of=()):
+    requirement = Requirement(any_of=any_of, all_of=([permission] if permission else []) + list(all_of))
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             jwt = get_token_auth_header()
             try:
-                payload = verify_decode_jwt(jwt)
+                payload, scopes = verify_token(jwt)
             except:
                 abort(401)
-            check_permissions(permission, payload)
+            check_permissions(requirement, payload, scopes)
             return f(payload, *args, **kwargs)
         return wrapper
-    return requires_auth_decorator
\ No newline at end of file
+    return requires_auth_decorator
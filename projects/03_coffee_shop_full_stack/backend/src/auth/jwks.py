@@ -0,0 +1,137 @@
+import json
+import threading
+import time
+from urllib.request import urlopen
+
+from .keys import KeyProvider
+
+# refresh() default, fetch whenever no other fetch is running
+ALWAYS = object()
+
+'''
+fetch_jwks(url)
+    downloads and parses a JSON Web Key Set
+    any url urlopen understands works, so tests can point it at a file:// path
+'''
+def fetch_jwks(url, timeout=5):
+    with urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+'''
+JWKSKeyStore
+    the KeyProvider of a remote JWKS endpoint (see keys.py)
+    keeps the signing keys of a JWKS endpoint in memory, indexed by kid
+
+    keys are fetched on first use and then refreshed every `ttl` seconds by
+    a background thread, so verifying a token needs no network round trip.
+    a token signed with a kid the store does not know triggers one refetch,
+    shared by every thread waiting on it (single flight) and at most once
+    every `min_refetch_interval` seconds, so random kids cannot hammer the
+    endpoint. when a refresh fails the previous keys are kept.
+'''
+class JWKSKeyStore(KeyProvider):
+    def __init__(self, url, ttl=600, min_refetch_interval=30, fetch=fetch_jwks):
+        self.url = url
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.fetch = fetch
+        self.keys = {}
+        self.fetched_at = None
+        self.lock = threading.Lock()
+        self.refreshed = threading.Condition(self.lock)
+        self.fetching = False
+        self.refresher = None
+        self.stopped = threading.Event()
+
+    '''
+    configure(url)
+        points the store at another JWKS url and drops the keys it holds
+    '''
+    def configure(self, url):
+        with self.lock:
+            self.url = url
+            self.keys = {}
+            self.fetched_at = None
+
+    '''
+    get(kid)
+        returns the key with the given kid, or None if the endpoint does not
+        publish it
+    '''
+    def get(self, kid):
+        self.start()
+        fetched_at = self.fetched_at
+        key = self.keys.get(kid)
+        if key is not None and not self.expired():
+            return key
+        if key is None and not self.may_refetch():
+            return None
+        self.refresh(fetched_at)
+        return self.keys.get(kid)
+
+    def expired(self):
+        # stale keys are only possible when the background refresh is failing
+        fetched_at = self.fetched_at
+        return fetched_at is None or time.monotonic() - fetched_at > 2 * self.ttl
+
+    def may_refetch(self):
+        fetched_at = self.fetched_at
+        return fetched_at is None or time.monotonic() - fetched_at >= self.min_refetch_interval
+
+    '''
+    refresh(seen)
+        fetches the key set, or waits for the fetch another thread already
+        started and uses its result. `seen` is the fetched_at the caller
+        looked at; if the keys were refreshed since then nothing is fetched
+    '''
+    def refresh(self, seen=ALWAYS):
+        with self.lock:
+            if self.fetching:
+                self.refreshed.wait_for(lambda: not self.fetching)
+                return
+            if seen is not ALWAYS and self.fetched_at != seen:
+                return
+            self.fetching = True
+            url = self.url
+
+        keys = None
+        try:
+            keys = {key['kid']: key for key in self.fetch(url)['keys'] if 'kid' in key}
+        except Exception:
+            pass
+        finally:
+            with self.lock:
+                if keys is not None and url == self.url:
+                    self.keys = keys
+                    self.fetched_at = time.monotonic()
+                self.fetching = False
+                self.refreshed.notify_all()
+
+    '''
+    start()
+        starts the background refresh thread, once per process
+    '''
+    def start(self):
+        if self.refresher is not None and self.refresher.is_alive():
+            return
+        with self.lock:
+            if self.refresher is not None and self.refresher.is_alive():
+                return
+            self.stopped.clear()
+            self.refresher = threading.Thread(target=self.run, name='jwks-refresh', daemon=True)
+            self.refresher.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            fetched_at = self.fetched_at
+            if fetched_at is None or time.monotonic() - fetched_at >= self.ttl:
+                self.refresh(fetched_at)
+                # retry failed refreshes sooner than the ttl
+                wait = self.ttl if self.fetched_at != fetched_at else min(self.ttl, self.min_refetch_interval)
+            else:
+                wait = self.ttl - (time.monotonic() - fetched_at)
+            self.stopped.wait(wait)
@@ -0,0 +1,86 @@
+import base64
+import time
+
+from Crypto.PublicKey import RSA
+from jose import jwt
+
+
+'''
+KeyProvider
+    where verify_decode_jwt gets the public key of a token's kid from
+    get(kid) returns the key as a JWK dict, or None if the kid is unknown
+    start() and stop() begin and end any background work of the provider
+
+    JWKSKeyStore (see jwks.py) reads the keys of a remote JWKS endpoint such
+    as the Auth0 tenant, LocalKeyProvider holds a keypair of its own
+'''
+class KeyProvider:
+    def get(self, kid):
+        raise NotImplementedError
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+def b64_int(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+'''
+LocalKeyProvider
+    an RSA keypair held in memory, which verifies tokens it minted itself
+    with mint(), so the auth path runs without an Auth0 tenant or network,
+    i.e. in tests and load tests
+
+    a new key is generated unless the PEM of `private_key` is given. tokens
+    are minted for `issuer` and `audience`, which have to be the ones
+    verify_decode_jwt checks
+'''
+class LocalKeyProvider(KeyProvider):
+    def __init__(self, issuer, audience, kid='local', private_key=None):
+        key = RSA.import_key(private_key) if private_key else RSA.generate(2048)
+        self.issuer = issuer
+        self.audience = audience
+        self.kid = kid
+        self.private_key = key.export_key().decode('ascii')
+        self.jwk = {
+            'kty': 'RSA',
+            'kid': kid,
+            'use': 'sig',
+            'alg': 'RS256',
+            'n': b64_int(key.n),
+            'e': b64_int(key.e)
+        }
+
+    def get(self, kid):
+        return self.jwk if kid == self.kid else None
+
+    '''
+    jwks()
+        the public key as a JSON Web Key Set, as a JWKS endpoint serves it
+    '''
+    def jwks(self):
+        return {'keys': [self.jwk]}
+
+    '''
+    mint(permissions, expires_in, subject, **claims)
+        returns a signed token carrying the given permissions, valid for
+        expires_in seconds. extra claims are added to (or replace) the
+        standard ones
+    '''
+    def mint(self, permissions=(), expires_in=3600, subject='auth0|local', **claims):
+        now = int(time.time())
+        payload = {
+            'iss': self.issuer,
+            'sub': subject,
+            'aud': self.audience,
+            'iat': now,
+            'exp': now + expires_in,
+            'permissions': list(permissions)
+        }
+        payload.update(claims)
+        return jwt.encode(payload, self.private_key, algorithm='RS256', headers={'kid': self.kid})
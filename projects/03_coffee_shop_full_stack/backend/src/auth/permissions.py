@@ -0,0 +1,80 @@
+import re
+
+
+'''
+scopes_of(payload)
+    the permissions claim of a verified payload as a frozenset, built once
+    per token and cached next to the payload (see tokens.py)
+    returns None when the token has no permissions claim, i.e. RBAC or
+    "Add Permissions in the Access Token" is off in Auth0
+'''
+def scopes_of(payload):
+    permissions = payload.get('permissions')
+    if permissions is None:
+        return None
+    return frozenset(permissions)
+
+'''
+compile_scope(scope)
+    turns a wildcard scope into a matcher, a * stands for any part of one
+    side of the colon, so '*:drinks' matches 'patch:drinks' and 'get:*'
+    matches 'get:drinks-detail'
+'''
+def compile_scope(scope):
+    pattern = '[^:]*'.join(re.escape(part) for part in scope.split('*'))
+    return re.compile(pattern + r'\Z').match
+
+
+'''
+Requirement
+    the permissions an endpoint requires, compiled once when the endpoint is
+    decorated: the token needs every scope in `all_of` and, if `any_of` is
+    given, at least one scope of `any_of`. scopes containing a * are
+    wildcards (see compile_scope)
+
+    exact scopes are checked with set operations against the token's
+    frozenset. wildcards have to match the token's scopes one by one, so
+    their outcome is remembered per frozenset; the frozenset is cached with
+    the token, which makes a repeated token a dict lookup
+'''
+class Requirement:
+    def __init__(self, any_of=(), all_of=(), max_decisions=1024):
+        self.any_of = tuple(any_of)
+        self.all_of = tuple(all_of)
+        self.any_exact = frozenset(scope for scope in self.any_of if '*' not in scope)
+        self.any_patterns = tuple(compile_scope(scope) for scope in self.any_of if '*' in scope)
+        self.all_exact = frozenset(scope for scope in self.all_of if '*' not in scope)
+        self.all_patterns = tuple(compile_scope(scope) for scope in self.all_of if '*' in scope)
+        self.max_decisions = max_decisions
+        self.decisions = {}
+
+    '''
+    satisfied_by(scopes)
+        whether a token with the given frozenset of scopes meets the requirement
+    '''
+    def satisfied_by(self, scopes):
+        if not self.all_exact <= scopes:
+            return False
+        if not self.any_patterns and not self.all_patterns:
+            return not self.any_of or not self.any_exact.isdisjoint(scopes)
+
+        decision = self.decisions.get(scopes)
+        if decision is None:
+            decision = self.match(scopes)
+            if len(self.decisions) >= self.max_decisions:
+                self.decisions.clear()
+            self.decisions[scopes] = decision
+        return decision
+
+    def match(self, scopes):
+        for match in self.all_patterns:
+            if not any(match(scope) for scope in scopes):
+                return False
+        if not self.any_of:
+            return True
+        if not self.any_exact.isdisjoint(scopes):
+            return True
+        return any(match(scope) for match in self.any_patterns for scope in scopes)
+
+    def __repr__(self):
+        return 'Requirement(any_of={!r}, all_of={!r})'.format(self.any_of, self.all_of)
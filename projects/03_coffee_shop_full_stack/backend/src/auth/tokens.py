@@ -0,0 +1,75 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+'''
+VerifiedTokenCache
+    remembers the payloads of tokens whose signature and claims were verified,
+    so a bearer token presented again skips the RSA verification
+
+    entries are keyed by the sha256 of the token, never the token itself,
+    expire at the token's `exp` claim and the least recently used entry is
+    dropped once `max_entries` are held. max_entries=0 disables the cache.
+    one lock guards the entries, so it is safe to share between the threads
+    of a threaded server.
+'''
+class VerifiedTokenCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).digest()
+
+    '''
+    get(token)
+        returns the cached payload of token, or None if it is not cached or
+        has expired
+    '''
+    def get(self, token):
+        entry = self.lookup(token)
+        return entry[0] if entry is not None else None
+
+    '''
+    lookup(token)
+        returns the cached (payload, scopes) of token, or None
+    '''
+    def lookup(self, token):
+        key = self.key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, payload, scopes = entry
+            if expires <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return payload, scopes
+
+    '''
+    set(token, payload, scopes)
+        caches the verified payload of token and the frozenset of its scopes
+        (see permissions.py) until its exp claim, tokens without exp are not
+        cached
+    '''
+    def set(self, token, payload, scopes=None):
+        expires = payload.get('exp')
+        if not self.max_entries or not isinstance(expires, (int, float)) or expires <= time.time():
+            return
+        key = self.key(token)
+        with self.lock:
+            self.entries[key] = (expires, payload, scopes)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
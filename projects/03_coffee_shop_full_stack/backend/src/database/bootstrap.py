@@ -0,0 +1,99 @@
+import os
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+
+'''
+PROFILES
+    the pragmas applied to every new SQLite connection, by profile name
+
+    default: SQLite's own settings, a rollback journal and an fsync on every
+        commit. stated explicitly so switching back from WAL takes effect
+    tuned: WAL lets readers carry on while a writer commits and, with
+        synchronous=NORMAL, syncs at checkpoints instead of every commit
+        (a power loss may drop the last commits, never corrupts the file).
+        busy_timeout makes a writer wait for the lock instead of failing
+        with "database is locked"; it comes first so it also covers the
+        journal mode switch
+'''
+PROFILES = {
+    'default': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL'
+    },
+    'tuned': {
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        # negative sizes are in KiB, 64 MiB
+        'cache_size': -64 * 1024
+    }
+}
+
+'''
+sqlite_pragmas(profile)
+    the pragmas of a profile, SQLITE_PROFILE (default 'tuned') if none is given
+    SQLITE_PRAGMAS overrides single pragmas, i.e. "busy_timeout=10000,mmap_size=0"
+'''
+def sqlite_pragmas(profile=None):
+    profile = profile or os.environ.get('SQLITE_PROFILE', 'tuned')
+    if profile not in PROFILES:
+        raise ValueError('unknown SQLite profile {!r}, expected one of {}'.format(profile, ', '.join(PROFILES)))
+
+    pragmas = dict(PROFILES[profile])
+    for setting in filter(None, os.environ.get('SQLITE_PRAGMAS', '').split(',')):
+        name, _, value = setting.partition('=')
+        pragmas[name.strip()] = value.strip()
+    return pragmas
+
+def is_sqlite_file(database_path):
+    url = make_url(database_path)
+    return url.drivername.startswith('sqlite') and url.database not in (None, '', ':memory:')
+
+'''
+engine_options(database_path, pool_size)
+    SQLALCHEMY_ENGINE_OPTIONS for the database: a SQLite file gets a pool of
+    `pool_size` connections (SQLITE_POOL_SIZE, default 5) instead of a new
+    connection, with its pragmas, per request. other databases keep the
+    defaults
+'''
+def engine_options(database_path, pool_size=None):
+    if not is_sqlite_file(database_path):
+        return {}
+    pool_size = pool_size or int(os.environ.get('SQLITE_POOL_SIZE', 5))
+    return {
+        'poolclass': QueuePool,
+        'pool_size': pool_size,
+        'max_overflow': 2 * pool_size,
+        # pooled connections are handed to whichever thread serves the request
+        'connect_args': {'check_same_thread': False}
+    }
+
+'''
+apply_pragmas(engine, pragmas)
+    runs the pragmas on every connection the engine opens
+'''
+def apply_pragmas(engine, pragmas):
+    statements = ['PRAGMA {}={}'.format(name, value) for name, value in pragmas.items()]
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+'''
+bootstrap(app, db, database_path, profile)
+    configures the app's engine for database_path before first use and, for
+    a SQLite file, applies the pragma profile (see sqlite_pragmas) to it
+'''
+def bootstrap(app, db, database_path, profile=None):
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
+    db.app = app
+    db.init_app(app)
+    if is_sqlite_file(database_path):
+        apply_pragmas(db.get_engine(app), sqlite_pragmas(profile))
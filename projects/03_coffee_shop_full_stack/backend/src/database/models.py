@@ -1,23 +1,28 @@
 import os
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, String, Integer, Text, exc, inspect, text
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from .bootstrap import bootstrap
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+# DATABASE_URL points the app at another database, e.g. a scratch one in tests
+database_path = os.environ.get('DATABASE_URL', "sqlite:///{}".format(os.path.join(project_dir, database_filename)))
 
 db = SQLAlchemy()
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    a SQLite database gets a connection pool and the pragmas of `profile`
+    (see bootstrap.py)
 '''
-def setup_db(app):
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+def setup_db(app, profile=None):
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    db.app = app
-    db.init_app(app)
+    bootstrap(app, db, database_path, profile)
+    with app.app_context():
+        add_recipe_columns()
 
 '''
 db_drop_and_create_all()
@@ -29,6 +34,85 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+encode_json(value)
+    encodes like jsonify outside debug mode, so pre-encoded parts can be
+    joined into a response body identical to a jsonify one
+'''
+def encode_json(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+'''
+encode_recipe(recipe)
+    returns the short and long form recipes of a recipe blob, encoded
+    raises ValueError if the recipe is not a list of ingredients
+'''
+def encode_recipe(recipe):
+    try:
+        ingredients = json.loads(recipe)
+        short = [{'color': r['color'], 'parts': r['parts']} for r in ingredients]
+    except (TypeError, KeyError, ValueError):
+        raise ValueError('recipe must be a list of ingredients with a color and parts')
+    return encode_json(short), encode_json(ingredients)
+
+'''
+drink_json(id, title, recipe)
+    a drink encoded as JSON bytes, from its id, title and encoded recipe
+'''
+def drink_json(id, title, recipe):
+    # keys in the order jsonify sorts them
+    return '{{"id":{},"recipe":{},"title":{}}}'.format(id, recipe, json.dumps(title)).encode('utf-8')
+
+'''
+add_recipe_columns()
+    adds the encoded recipe columns to a drink table created before them and
+    fills them in for existing drinks
+'''
+def add_recipe_columns():
+    inspector = inspect(db.engine)
+    if 'drink' not in inspector.get_table_names():
+        return
+    if 'short_recipe' in [column['name'] for column in inspector.get_columns('drink')]:
+        return
+    with db.engine.begin() as connection:
+        connection.execute('ALTER TABLE drink ADD COLUMN short_recipe TEXT')
+        connection.execute('ALTER TABLE drink ADD COLUMN long_recipe TEXT')
+        for id, recipe in connection.execute('SELECT id, recipe FROM drink').fetchall():
+            try:
+                short_recipe, long_recipe = encode_recipe(recipe)
+            except ValueError:
+                # left empty, the drink fails when it is read as it did before
+                continue
+            connection.execute(text('UPDATE drink SET short_recipe = :short, long_recipe = :long WHERE id = :id'),
+                               short=short_recipe, long=long_recipe, id=id)
+
+'''
+DrinkConflict
+    raised when a write would give a drink the title of another drink
+'''
+class DrinkConflict(Exception):
+    pass
+
+# the statements behind Drink.create, Drink.upsert and Drink.patch
+# ON CONFLICT needs SQLite 3.24 or Postgres 9.5, RETURNING SQLite 3.35
+INSERT_DRINK = text(
+    'INSERT INTO drink (title, recipe, short_recipe, long_recipe) '
+    'VALUES (:title, :recipe, :short_recipe, :long_recipe) '
+    'ON CONFLICT (title) DO NOTHING '
+    'RETURNING id, title, recipe, short_recipe, long_recipe')
+UPSERT_DRINK = text(
+    'INSERT INTO drink (title, recipe, short_recipe, long_recipe) '
+    'VALUES (:title, :recipe, :short_recipe, :long_recipe) '
+    'ON CONFLICT (title) DO UPDATE SET recipe = excluded.recipe, '
+    'short_recipe = excluded.short_recipe, long_recipe = excluded.long_recipe '
+    'RETURNING id, title, recipe, short_recipe, long_recipe')
+PATCH_DRINK = text(
+    'UPDATE drink SET title = coalesce(:title, title), recipe = coalesce(:recipe, recipe), '
+    'short_recipe = coalesce(:short_recipe, short_recipe), long_recipe = coalesce(:long_recipe, long_recipe) '
+    'WHERE id = :id AND NOT EXISTS '
+    '(SELECT 1 FROM drink AS other WHERE other.title = :title AND other.id <> :id) '
+    'RETURNING id, title, recipe, short_recipe, long_recipe')
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -41,35 +125,81 @@ class Drink(db.Model):
     # the ingredients blob - this stores a lazy json blob
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
     recipe =  Column(String(180), nullable=False)
+    # the short and long form recipes, encoded when the drink is written
+    short_recipe = Column(Text)
+    long_recipe = Column(Text)
 
     def __init__(self, title, recipe):
         self.title = title
         self.recipe = recipe
 
+    '''
+    encode()
+        stores the encoded short and long form recipes of the recipe blob
+    '''
+    def encode(self):
+        self.short_recipe, self.long_recipe = encode_recipe(self.recipe)
+
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
+        if self.short_recipe is None:
+            self.encode()
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': json.loads(self.short_recipe)
         }
 
+    '''
+    short_json()
+        short() encoded as JSON bytes
+    '''
+    def short_json(self):
+        if self.short_recipe is None:
+            self.encode()
+        return drink_json(self.id, self.title, self.short_recipe)
+
     '''
     long()
         long form representation of the Drink model
     '''
     def long(self):
+        if self.long_recipe is None:
+            self.encode()
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': json.loads(self.long_recipe)
         }
 
+    '''
+    long_json()
+        long() encoded as JSON bytes
+    '''
+    def long_json(self):
+        if self.long_recipe is None:
+            self.encode()
+        return drink_json(self.id, self.title, self.long_recipe)
+
+    '''
+    iter_json(form, batch)
+        the short or long form JSON (see short_json) of every drink, read
+        `batch` rows at a time with yield_per, so memory does not grow with
+        the number of drinks. only the columns are read, the stored
+        encoded recipe is used as it is and no Drink objects are built
+    '''
+    @classmethod
+    def iter_json(cls, form='short', batch=500):
+        encoded = cls.short_recipe if form == 'short' else cls.long_recipe
+        for id, title, recipe, encoded_recipe in db.session.query(cls.id, cls.title, cls.recipe, encoded).yield_per(batch):
+            if encoded_recipe is None:
+                # a recipe add_recipe_columns could not encode, fails as short() would
+                encoded_recipe = encode_recipe(recipe)[form != 'short']
+            yield drink_json(id, title, encoded_recipe)
+
     '''
     insert()
         inserts a new model into a database
@@ -80,6 +210,7 @@ class Drink(db.Model):
             drink.insert()
     '''
     def insert(self):
+        self.encode()
         db.session.add(self)
         db.session.commit()
 
@@ -105,7 +236,74 @@ class Drink(db.Model):
             drink.update()
     '''
     def update(self):
+        self.encode()
         db.session.commit()
 
+    '''
+    create(title, recipe)
+        inserts a drink and returns it in one statement
+        raises DrinkConflict if a drink with the title exists, without a
+        failed commit and rollback, and ValueError for a malformed recipe
+        EXAMPLE
+            drink = Drink.create(req_title, req_recipe)
+    '''
+    @classmethod
+    def create(cls, title, recipe):
+        drink = cls.write(INSERT_DRINK, cls.values(title, recipe))
+        if drink is None:
+            raise DrinkConflict(title)
+        return drink
+
+    '''
+    upsert(title, recipe)
+        inserts a drink, or replaces the recipe of the drink with the title,
+        and returns it in one statement
+    '''
+    @classmethod
+    def upsert(cls, title, recipe):
+        return cls.write(UPSERT_DRINK, cls.values(title, recipe))
+
+    '''
+    patch(id, title, recipe)
+        updates the title and/or recipe (None keeps the current value) of a
+        drink and returns it in one statement, None if there is no such drink
+        raises DrinkConflict if another drink has the title and ValueError
+        for a malformed recipe
+    '''
+    @classmethod
+    def patch(cls, id, title=None, recipe=None):
+        values = cls.values(title, recipe)
+        values['id'] = id
+        drink = cls.write(PATCH_DRINK, values)
+        if drink is None and title is not None:
+            # the one extra query is paid only when nothing was updated
+            if db.session.query(cls.id).filter(cls.id == id).scalar() is not None:
+                raise DrinkConflict(title)
+        return drink
+
+    @staticmethod
+    def values(title, recipe):
+        # the statement parameters, with the recipe encoded (None if not given)
+        short_recipe, long_recipe = encode_recipe(recipe) if recipe is not None else (None, None)
+        return {'title': title, 'recipe': recipe, 'short_recipe': short_recipe, 'long_recipe': long_recipe}
+
+    @classmethod
+    def write(cls, statement, params):
+        try:
+            row = db.session.execute(statement, params).fetchone()
+            db.session.commit()
+        except exc.IntegrityError:
+            # a concurrent write took the title between the check and the write
+            db.session.rollback()
+            raise DrinkConflict(params['title'])
+        if row is None:
+            return None
+        # a detached copy of the returned row, enough to represent it
+        drink = cls(row.title, row.recipe)
+        drink.id = row.id
+        drink.short_recipe = row.short_recipe
+        drink.long_recipe = row.long_recipe
+        return drink
+
     def __repr__(self):
         return json.dumps(self.short())
\ No newline at end of file
@@ -0,0 +1,295 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import event
+
+# the api module binds its database on import, so point it at a scratch one first
+directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///{}'.format(os.path.join(directory, 'test.db'))
+
+from src import api
+from src.auth import auth
+from src.auth.keys import LocalKeyProvider
+from src.database import bootstrap
+from src.database.models import add_recipe_columns, db, Drink
+
+def tearDownModule():
+    shutil.rmtree(directory)
+
+#----------------------------------------------------------------------------#
+# Setup of Unittest
+#----------------------------------------------------------------------------#
+
+class DrinksTestCase(unittest.TestCase):
+    """Checks the drink endpoints against a scratch SQLite database"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.keys = LocalKeyProvider(auth.ISSUER, auth.API_AUDIENCE)
+
+    def setUp(self):
+        self.client = api.app.test_client
+        self.original_store = auth.key_store
+        auth.key_store = self.keys
+        with api.app.app_context():
+            db.drop_all()
+            db.create_all()
+            Drink(title='water', recipe=json.dumps([{'name': 'water', 'color': 'blue', 'parts': 1}])).insert()
+            Drink(title='latte', recipe=json.dumps([
+                {'name': 'milk', 'color': 'white', 'parts': 3},
+                {'name': 'espresso', 'color': 'brown', 'parts': 1}
+            ])).insert()
+
+    def tearDown(self):
+        auth.key_store = self.original_store
+        auth.token_cache.clear()
+
+    def headers(self, *permissions):
+        return {'Authorization': 'Bearer ' + self.keys.mint(permissions)}
+
+#----------------------------------------------------------------------------#
+# Tests for the drink representations
+#----------------------------------------------------------------------------#
+
+    def test_get_drinks(self):
+        res = self.client().get('/drinks')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/json')
+        self.assertEqual(data, {'success': True, 'drinks': [
+            {'id': 1, 'title': 'water', 'recipe': [{'color': 'blue', 'parts': 1}]},
+            {'id': 2, 'title': 'latte', 'recipe': [{'color': 'white', 'parts': 3}, {'color': 'brown', 'parts': 1}]}
+        ]})
+
+    def test_get_drinks_matches_jsonify(self):
+        res = self.client().get('/drinks')
+        with api.app.app_context():
+            expected = api.jsonify({'success': True, 'drinks': [drink.short() for drink in Drink.query.all()]})
+
+        self.assertEqual(res.data, expected.data)
+
+    def test_get_drinks_detail(self):
+        res = self.client().get('/drinks-detail', headers=self.headers('get:drinks-detail'))
+        with api.app.app_context():
+            expected = api.jsonify({'success': True, 'drinks': [drink.long() for drink in Drink.query.all()]})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data, expected.data)
+        self.assertEqual(json.loads(res.data)['drinks'][1]['recipe'][1]['name'], 'espresso')
+
+    def test_edited_drink_is_reencoded(self):
+        res = self.client().patch('/drinks/2', json={'title': 'flat white'},
+                                  headers=self.headers('patch:drinks'))
+        self.assertEqual(res.status_code, 200)
+
+        data = json.loads(self.client().get('/drinks').data)
+        self.assertEqual(data['drinks'][1]['title'], 'flat white')
+
+    def test_representations_are_stored_with_the_drink(self):
+        with api.app.app_context():
+            row = db.session.execute('SELECT short_recipe, long_recipe FROM drink WHERE id = 1').fetchone()
+
+        self.assertEqual(json.loads(row.short_recipe), [{'color': 'blue', 'parts': 1}])
+        self.assertEqual(json.loads(row.long_recipe), [{'name': 'water', 'color': 'blue', 'parts': 1}])
+
+    def test_short_returns_a_copy(self):
+        with api.app.app_context():
+            drink = Drink.query.get(1)
+            drink.short()['recipe'].append({'color': 'red', 'parts': 9})
+            drink.long()['title'] = 'changed'
+
+            self.assertEqual(drink.short()['recipe'], [{'color': 'blue', 'parts': 1}])
+            self.assertEqual(drink.long()['title'], 'water')
+
+    def test_malformed_recipe(self):
+        res = self.client().post('/drinks', json={'title': 'mud', 'recipe': [{'name': 'mud'}]},
+                                 headers=self.headers('post:drinks'))
+
+        self.assertEqual(res.status_code, 422)
+
+    def test_recipe_columns_added_to_existing_table(self):
+        with api.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.session.execute('CREATE TABLE drink (id INTEGER NOT NULL, title VARCHAR(80), '
+                               'recipe VARCHAR(180) NOT NULL, PRIMARY KEY (id), UNIQUE (title))')
+            db.session.execute('''INSERT INTO drink (title, recipe) VALUES ('tea', '[{"name": "tea", "color": "green", "parts": 1}]')''')
+            db.session.commit()
+            add_recipe_columns()
+
+        data = json.loads(self.client().get('/drinks').data)
+        self.assertEqual(data['drinks'], [{'id': 1, 'title': 'tea', 'recipe': [{'color': 'green', 'parts': 1}]}])
+
+    def test_representations_do_not_print(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.client().get('/drinks')
+
+        self.assertEqual(output.getvalue(), '')
+
+    def test_get_drinks_streams_in_chunks(self):
+        with api.app.app_context():
+            for i in range(5):
+                Drink(title='tea {}'.format(i), recipe=json.dumps([{'name': 'tea', 'color': 'green', 'parts': i}])).insert()
+            expected = api.jsonify({'success': True, 'drinks': [drink.short() for drink in Drink.query.all()]})
+
+        chunk_size = api.DRINKS_PER_CHUNK
+        api.DRINKS_PER_CHUNK = 3
+        try:
+            res = self.client().get('/drinks', buffered=False)
+            chunks = list(res.response)
+            res.close()
+        finally:
+            api.DRINKS_PER_CHUNK = chunk_size
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(b''.join(chunks), expected.data)
+
+    def test_get_drinks_error_after_first_chunk(self):
+        def failing(form):
+            yield Drink.query.get(1).short_json()
+            yield Drink.query.get(2).short_json()
+            raise RuntimeError('lost the database')
+
+        iter_json = Drink.iter_json
+        chunk_size = api.DRINKS_PER_CHUNK
+        Drink.iter_json = failing
+        api.DRINKS_PER_CHUNK = 1
+        try:
+            res = self.client().get('/drinks', buffered=False)
+            body = iter(res.response)
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(next(body).startswith(b'{"drinks":[{"id":1,'))
+            with self.assertLogs(api.app.logger, 'ERROR'):
+                with self.assertRaises(RuntimeError):
+                    list(body)
+        finally:
+            Drink.iter_json = iter_json
+            api.DRINKS_PER_CHUNK = chunk_size
+
+    def test_get_drinks_reads_stored_recipes(self):
+        with api.app.app_context():
+            db.session.execute('UPDATE drink SET short_recipe = :recipe WHERE id = 1',
+                               {'recipe': '[{"color":"stored","parts":1}]'})
+            db.session.commit()
+
+        data = json.loads(self.client().get('/drinks').data)
+        self.assertEqual(data['drinks'][0]['recipe'], [{'color': 'stored', 'parts': 1}])
+
+    def test_get_drinks_empty(self):
+        with api.app.app_context():
+            Drink.query.delete()
+            db.session.commit()
+        res = self.client().get('/drinks')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data), {'success': True, 'drinks': []})
+
+#----------------------------------------------------------------------------#
+# Tests for the conflict-free writes
+#----------------------------------------------------------------------------#
+
+    def test_create_drink(self):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with api.app.app_context():
+            engine = db.get_engine()
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            res = self.client().post('/drinks', json={'title': 'mocha', 'recipe': [{'name': 'cocoa', 'color': 'brown', 'parts': 1}]},
+                                     headers=self.headers('post:drinks'))
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['drinks'], {'id': 3, 'title': 'mocha', 'recipe': [{'name': 'cocoa', 'color': 'brown', 'parts': 1}]})
+        # the row comes back from the insert itself
+        self.assertEqual(len(statements), 1)
+
+    def test_create_duplicate_drink(self):
+        res = self.client().post('/drinks', json={'title': 'latte', 'recipe': '[]'},
+                                 headers=self.headers('post:drinks'))
+
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(json.loads(res.data)['message'], 'Conflict')
+        self.assertEqual(len(json.loads(self.client().get('/drinks').data)['drinks']), 2)
+
+    def test_patch_drink_to_taken_title(self):
+        res = self.client().patch('/drinks/1', json={'title': 'latte'}, headers=self.headers('patch:drinks'))
+
+        self.assertEqual(res.status_code, 409)
+        data = json.loads(self.client().get('/drinks').data)
+        self.assertEqual([drink['title'] for drink in data['drinks']], ['water', 'latte'])
+
+    def test_patch_missing_drink(self):
+        res = self.client().patch('/drinks/1000', json={'title': 'mocha'}, headers=self.headers('patch:drinks'))
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_patch_drink_recipe(self):
+        recipe = [{'name': 'tea', 'color': 'green', 'parts': 2}]
+        res = self.client().patch('/drinks/2', json={'recipe': recipe}, headers=self.headers('patch:drinks'))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['drinks'], [{'id': 2, 'title': 'latte', 'recipe': recipe}])
+
+    def test_upsert_drink(self):
+        headers = self.headers('post:drinks', 'patch:drinks')
+        recipe = [{'name': 'water', 'color': 'clear', 'parts': 2}]
+
+        res = self.client().put('/drinks', json={'title': 'water', 'recipe': recipe}, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['drinks'], [{'id': 1, 'title': 'water', 'recipe': recipe}])
+
+        res = self.client().put('/drinks', json={'title': 'soda', 'recipe': recipe}, headers=headers)
+        self.assertEqual(json.loads(res.data)['drinks'][0]['id'], 3)
+
+    def test_upsert_needs_both_permissions(self):
+        res = self.client().put('/drinks', json={'title': 'soda', 'recipe': []}, headers=self.headers('post:drinks'))
+
+        self.assertEqual(res.status_code, 401)
+
+#----------------------------------------------------------------------------#
+# Tests for the SQLite bootstrap
+#----------------------------------------------------------------------------#
+
+class BootstrapTestCase(unittest.TestCase):
+    """Checks the pragma profiles and pool the database is set up with"""
+
+    def test_app_connections_use_the_tuned_profile(self):
+        with api.app.app_context():
+            self.assertEqual(db.session.execute('PRAGMA journal_mode').scalar(), 'wal')
+            self.assertEqual(db.session.execute('PRAGMA busy_timeout').scalar(), 5000)
+            self.assertEqual(db.get_engine().pool.size(), 5)
+
+    def test_pragma_overrides(self):
+        os.environ['SQLITE_PRAGMAS'] = 'busy_timeout=100, mmap_size=0'
+        try:
+            pragmas = bootstrap.sqlite_pragmas('tuned')
+        finally:
+            del os.environ['SQLITE_PRAGMAS']
+
+        self.assertEqual(pragmas['busy_timeout'], '100')
+        self.assertEqual(pragmas['mmap_size'], '0')
+        self.assertEqual(pragmas['journal_mode'], 'WAL')
+        self.assertRaises(ValueError, bootstrap.sqlite_pragmas, 'fastest')
+
+    def test_engine_options_only_pool_sqlite_files(self):
+        self.assertEqual(bootstrap.engine_options('postgresql://localhost/coffee'), {})
+        self.assertEqual(bootstrap.engine_options('sqlite://'), {})
+        self.assertEqual(bootstrap.engine_options('sqlite:////tmp/coffee.db', 3)['pool_size'], 3)
+
+# Make the tests conveniently executable.
+if __name__ == "__main__":
+    unittest.main()
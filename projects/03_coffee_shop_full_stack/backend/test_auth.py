@@ -0,0 +1,253 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from flask import Flask
+from jose import jwt
+from werkzeug.exceptions import BadRequest, Unauthorized
+
+from src.auth import auth
+from src.auth.auth import AuthError, verify_decode_jwt
+from src.auth.jwks import JWKSKeyStore, fetch_jwks
+from src.auth.keys import LocalKeyProvider
+from src.auth.permissions import Requirement
+from src.auth.tokens import VerifiedTokenCache
+
+#----------------------------------------------------------------------------#
+# Helpers
+#----------------------------------------------------------------------------#
+
+def make_key(kid):
+    keys = LocalKeyProvider(auth.ISSUER, auth.API_AUDIENCE, kid=kid)
+    return keys.private_key, keys.jwk
+
+def make_token(private_key, kid, permissions=(), expires_in=3600):
+    keys = LocalKeyProvider(auth.ISSUER, auth.API_AUDIENCE, kid=kid, private_key=private_key)
+    return keys.mint(permissions, expires_in, subject='auth0|tester')
+
+#----------------------------------------------------------------------------#
+# Setup of Unittest
+#----------------------------------------------------------------------------#
+
+class AuthTestCase(unittest.TestCase):
+    """Verifies tokens against a JWKS file instead of the Auth0 tenant"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.first_private, cls.first_jwk = make_key('first')
+        cls.second_private, cls.second_jwk = make_key('second')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.jwks_path = os.path.join(self.directory, 'jwks.json')
+        self.write_jwks(self.first_jwk)
+        self.fetches = 0
+
+        self.store = JWKSKeyStore('file://' + self.jwks_path, fetch=self.counting_fetch)
+        self.original_store = auth.key_store
+        auth.key_store = self.store
+        auth.token_cache.clear()
+
+    def tearDown(self):
+        self.store.stop()
+        auth.key_store = self.original_store
+        auth.token_cache.clear()
+        shutil.rmtree(self.directory)
+
+    def write_jwks(self, *keys):
+        with open(self.jwks_path, 'w') as f:
+            json.dump({'keys': list(keys)}, f)
+
+    def counting_fetch(self, url):
+        self.fetches += 1
+        return fetch_jwks(url)
+
+#----------------------------------------------------------------------------#
+# Tests for the key store
+#----------------------------------------------------------------------------#
+
+    def test_verifies_without_refetching(self):
+        token = make_token(self.first_private, 'first', ['get:drinks-detail'])
+        for _ in range(20):
+            payload = verify_decode_jwt(token)
+        self.assertEqual(payload['permissions'], ['get:drinks-detail'])
+        self.assertEqual(self.fetches, 1)
+
+    def test_unknown_kid_refetches_once(self):
+        verify_decode_jwt(make_token(self.first_private, 'first'))
+        self.store.min_refetch_interval = 0
+        self.write_jwks(self.first_jwk, self.second_jwk)
+
+        payload = verify_decode_jwt(make_token(self.second_private, 'second', ['post:drinks']))
+
+        self.assertEqual(payload['permissions'], ['post:drinks'])
+        self.assertEqual(self.fetches, 2)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        verify_decode_jwt(make_token(self.first_private, 'first'))
+        self.write_jwks(self.first_jwk, self.second_jwk)
+
+        with self.assertRaises(AuthError):
+            verify_decode_jwt(make_token(self.second_private, 'second'))
+        self.assertEqual(self.fetches, 1)
+
+    def test_concurrent_unknown_kid_single_flight(self):
+        release = threading.Event()
+
+        def slow_fetch(url):
+            self.fetches += 1
+            release.wait(5)
+            return fetch_jwks(url)
+
+        store = JWKSKeyStore('file://' + self.jwks_path, fetch=slow_fetch)
+        threads = [threading.Thread(target=store.get, args=('first',)) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join()
+        store.stop()
+
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual(store.get('first')['kid'], 'first')
+
+    def test_failed_refresh_keeps_keys(self):
+        self.store.get('first')
+        os.remove(self.jwks_path)
+        self.store.refresh()
+
+        self.assertEqual(self.store.get('first')['kid'], 'first')
+
+#----------------------------------------------------------------------------#
+# Tests for the verified token cache
+#----------------------------------------------------------------------------#
+
+    def test_repeated_token_skips_verification(self):
+        token = make_token(self.first_private, 'first', ['patch:drinks'])
+        verify_decode_jwt(token)
+        # without its key the token could not be verified again
+        self.store.keys = {}
+
+        self.assertEqual(verify_decode_jwt(token)['permissions'], ['patch:drinks'])
+
+    def test_cache_is_keyed_by_token_hash(self):
+        token = make_token(self.first_private, 'first')
+        verify_decode_jwt(token)
+
+        self.assertEqual(list(auth.token_cache.entries), [VerifiedTokenCache.key(token)])
+
+    def test_cache_expires_at_exp(self):
+        cache = VerifiedTokenCache()
+        cache.set('soon', {'exp': time.time() + 0.2})
+        cache.set('expired', {'exp': time.time() - 1})
+        cache.set('no exp', {})
+
+        self.assertIsNotNone(cache.get('soon'))
+        self.assertIsNone(cache.get('expired'))
+        self.assertIsNone(cache.get('no exp'))
+        time.sleep(0.3)
+        self.assertIsNone(cache.get('soon'))
+
+    def test_cache_drops_least_recently_used(self):
+        cache = VerifiedTokenCache(max_entries=2)
+        expires = time.time() + 60
+        cache.set('a', {'exp': expires})
+        cache.set('b', {'exp': expires})
+        cache.get('a')
+        cache.set('c', {'exp': expires})
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+#----------------------------------------------------------------------------#
+# Tests for permission checks
+#----------------------------------------------------------------------------#
+
+    def test_scopes_are_cached_with_the_payload(self):
+        token = make_token(self.first_private, 'first', ['get:drinks-detail', 'post:drinks'])
+        payload, scopes = auth.verify_token(token)
+
+        self.assertEqual(scopes, frozenset(['get:drinks-detail', 'post:drinks']))
+        self.assertIs(auth.token_cache.lookup(token)[1], scopes)
+
+    def test_requirement_all_of_and_any_of(self):
+        scopes = frozenset(['get:drinks-detail', 'post:drinks'])
+
+        self.assertTrue(Requirement(all_of=['get:drinks-detail', 'post:drinks']).satisfied_by(scopes))
+        self.assertFalse(Requirement(all_of=['get:drinks-detail', 'delete:drinks']).satisfied_by(scopes))
+        self.assertTrue(Requirement(any_of=['delete:drinks', 'post:drinks']).satisfied_by(scopes))
+        self.assertFalse(Requirement(any_of=['delete:drinks', 'patch:drinks']).satisfied_by(scopes))
+        self.assertTrue(Requirement().satisfied_by(scopes))
+
+    def test_requirement_wildcards(self):
+        scopes = frozenset(['get:drinks-detail', 'patch:drinks'])
+
+        self.assertTrue(Requirement(all_of=['*:drinks']).satisfied_by(scopes))
+        self.assertTrue(Requirement(all_of=['get:*']).satisfied_by(scopes))
+        self.assertFalse(Requirement(all_of=['*:recipes']).satisfied_by(scopes))
+        self.assertFalse(Requirement(all_of=['*:drinks', 'delete:*']).satisfied_by(scopes))
+        self.assertTrue(Requirement(any_of=['delete:drinks', '*:drinks-detail']).satisfied_by(scopes))
+        # a * does not reach across the colon
+        self.assertFalse(Requirement(all_of=['*drinks']).satisfied_by(scopes))
+
+    def test_requires_auth_any_of(self):
+        app = Flask(__name__)
+
+        @auth.requires_auth(any_of=['patch:drinks', 'delete:drinks'])
+        def endpoint(payload):
+            return payload['sub']
+
+        for permissions, allowed in [(['delete:drinks'], True), (['post:drinks'], False)]:
+            token = make_token(self.first_private, 'first', permissions)
+            with app.test_request_context(headers={'Authorization': 'Bearer ' + token}):
+                if allowed:
+                    self.assertEqual(endpoint(), 'auth0|tester')
+                else:
+                    self.assertRaises(Unauthorized, endpoint)
+
+    def test_requires_auth_without_permissions_claim(self):
+        app = Flask(__name__)
+
+        @auth.requires_auth('get:drinks-detail')
+        def endpoint(payload):
+            return payload
+
+        claims = jwt.get_unverified_claims(make_token(self.first_private, 'first'))
+        del claims['permissions']
+        token = jwt.encode(claims, self.first_private, algorithm='RS256', headers={'kid': 'first'})
+        with app.test_request_context(headers={'Authorization': 'Bearer ' + token}):
+            self.assertRaises(BadRequest, endpoint)
+
+#----------------------------------------------------------------------------#
+# Tests for the local key provider
+#----------------------------------------------------------------------------#
+
+    def test_local_keys_verify_minted_tokens(self):
+        keys = auth.use_local_keys('load')
+        try:
+            payload = verify_decode_jwt(keys.mint(['post:drinks'], subject='auth0|load'))
+            self.assertEqual(payload['sub'], 'auth0|load')
+            self.assertEqual(payload['permissions'], ['post:drinks'])
+            # tokens signed with any other key are rejected
+            with self.assertRaises(AuthError):
+                verify_decode_jwt(make_token(self.first_private, 'first'))
+        finally:
+            auth.key_store = self.store
+
+    def test_local_keys_reject_expired_tokens(self):
+        keys = LocalKeyProvider(auth.ISSUER, auth.API_AUDIENCE, kid='first', private_key=self.first_private)
+        auth.key_store = keys
+
+        with self.assertRaises(AuthError) as raised:
+            verify_decode_jwt(keys.mint(expires_in=-60))
+        self.assertEqual(raised.exception.error['code'], 'token_expired')
+
+# Make the tests conveniently executable.
+if __name__ == "__main__":
+    unittest.main()
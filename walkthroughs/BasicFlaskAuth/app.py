@@ -1,5 +1,8 @@
 from flask import Flask, request, abort
+import hashlib
 import json
+import re
+import time
 from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
@@ -105,24 +108,78 @@ def verify_decode_jwt(token):
             }, 400)
 
 
-def check_permissions(permission, payload):
-    if 'permissions' not in payload:
+def compile_scope(scope):
+    # turns a wildcard scope into a matcher, a * stands for any part of one
+    # side of the colon, so '*:images' matches 'get:images'. the same
+    # matcher as the coffee shop's src/auth/permissions.py
+    pattern = '[^:]*'.join(re.escape(part) for part in scope.split('*'))
+    return re.compile(pattern + r'\Z').match
+
+
+def compile_requirement(any_of=(), all_of=()):
+    # built once per decorated endpoint, returns a check run against the
+    # token's permissions as a frozenset: every scope of all_of and, if
+    # any_of is given, one scope of any_of. exact scopes are set lookups,
+    # only wildcards are matched against the scopes one by one
+    any_exact = frozenset(scope for scope in any_of if '*' not in scope)
+    any_patterns = [compile_scope(scope) for scope in any_of if '*' in scope]
+    all_exact = frozenset(scope for scope in all_of if '*' not in scope)
+    all_patterns = [compile_scope(scope) for scope in all_of if '*' in scope]
+
+    def satisfied_by(scopes):
+        if not all_exact <= scopes:
+            return False
+        for match in all_patterns:
+            if not any(match(scope) for scope in scopes):
+                return False
+        if not any_of or not any_exact.isdisjoint(scopes):
+            return True
+        return any(match(scope) for match in any_patterns for scope in scopes)
+    return satisfied_by
+
+
+# verified tokens by their sha256: (exp, payload, frozenset of permissions),
+# so a token presented again skips fetching the keys and the RSA verification
+MAX_VERIFIED_TOKENS = 1024
+verified_tokens = {}
+
+
+def verify_token(token):
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    entry = verified_tokens.get(key)
+    if entry is not None and entry[0] > time.time():
+        return entry[1], entry[2]
+
+    payload = verify_decode_jwt(token)
+    permissions = payload.get('permissions')
+    scopes = frozenset(permissions) if permissions is not None else None
+    if isinstance(payload.get('exp'), (int, float)):
+        if len(verified_tokens) >= MAX_VERIFIED_TOKENS:
+            verified_tokens.clear()
+        verified_tokens[key] = (payload['exp'], payload, scopes)
+    return payload, scopes
+
+
+def check_permissions(requirement, scopes):
+    if scopes is None:
         abort(400)
 
-    if permission not in payload['permissions']:
+    if not requirement(scopes):
         abort(403)
     return True
 
-def requires_auth(permission=''):
+def requires_auth(permission='', any_of=(), all_of=()):
+    requirement = compile_requirement(any_of, ([permission] if permission else []) + list(all_of))
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             jwt = get_token_auth_header()
             try:
-                payload = verify_decode_jwt(jwt)
+                payload, scopes = verify_token(jwt)
             except:
                 abort(401)
-            check_permissions(permission, payload)
+            check_permissions(requirement, scopes)
             return f(payload, *args, **kwargs)
         return wrapper
     return requires_auth_decorator
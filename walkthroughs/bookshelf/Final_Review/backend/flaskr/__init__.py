@@ -1,8 +1,13 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, Response, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy #, or_
 from flask_cors import CORS
 
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
 from models import setup_db, Book
 
 BOOKS_PER_SHELF = 8
@@ -29,20 +34,35 @@ BOOKS_PER_SHELF = 8
 
 def paginate_books(request, selection):
   page = request.args.get('page', 1, type=int)
+  if page < 1:
+    return []
+
   start =  (page - 1) * BOOKS_PER_SHELF
-  end = start + BOOKS_PER_SHELF
 
-  books = [book.format() for book in selection]
-  current_books = books[start:end]
+  # only the rows of the page are read, as plain tuples of the format() columns
+  columns = Book.format_columns()
+  rows = selection.offset(start).limit(BOOKS_PER_SHELF).with_entities(*columns)
+  current_books = [dict(zip([column.key for column in columns], row)) for row in rows]
 
   return current_books
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  # FAST_JSON encodes book lists with orjson instead of jsonify, same keys and values.
+  # off unless asked for with create_app({'FAST_JSON': True}) and orjson is installed
+  app.config.from_mapping(FAST_JSON=False)
+  if test_config is not None:
+    app.config.from_mapping(test_config)
   setup_db(app)
   CORS(app)
 
+  def respond(payload):
+    if app.config['FAST_JSON'] and orjson is not None:
+      return Response(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE),
+                      mimetype='application/json')
+    return jsonify(payload)
+
   # CORS Headers 
   @app.after_request
   def after_request(response):
@@ -53,16 +73,16 @@ def create_app(test_config=None):
   
   @app.route('/books')
   def retrieve_books():
-    selection = Book.query.order_by(Book.id).all()
+    selection = Book.query.order_by(Book.id)
     current_books = paginate_books(request, selection)
 
     if len(current_books) == 0:
       abort(404)
 
-    return jsonify({
+    return respond({
       'success': True,
       'books': current_books,
-      'total_books': len(Book.query.all())
+      'total_books': Book.query.count()
     })
     
   # @app.route('/books/<int:book_id>')
@@ -107,14 +127,14 @@ def create_app(test_config=None):
         abort(404)
 
       book.delete()
-      selection = Book.query.order_by(Book.id).all()
+      selection = Book.query.order_by(Book.id)
       current_books = paginate_books(request, selection)
 
-      return jsonify({
+      return respond({
         'success': True,
         'deleted': book_id,
         'books': current_books,
-        'total_books': len(Book.query.all())
+        'total_books': Book.query.count()
       })
 
     except:
@@ -135,23 +155,23 @@ def create_app(test_config=None):
         #selection = Book.query.order_by(Book.id).filter(or_(Book.title.ilike('%{}%'.format(search)), Book.author.ilike('%{}%'.format(search))))
         current_books = paginate_books(request, selection)
 
-        return jsonify({
+        return respond({
           'success': True,
           'books': current_books,
-          'total_books': len(selection.all())
+          'total_books': selection.count()
         })
       else: 
         book = Book(title=new_title, author=new_author, rating=new_rating)
         book.insert()
 
-        selection = Book.query.order_by(Book.id).all()
+        selection = Book.query.order_by(Book.id)
         current_books = paginate_books(request, selection)
 
-        return jsonify({
+        return respond({
           'success': True,
           'created': book.id,
           'books': current_books,
-          'total_books': len(Book.query.all())
+          'total_books': Book.query.count()
         })
 
     except:
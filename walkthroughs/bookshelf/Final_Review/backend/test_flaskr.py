@@ -55,6 +55,28 @@ class BookTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['total_books'])
         self.assertTrue(len(data['books']))
+
+    def test_paginated_books_match_format(self):
+        with self.app.app_context():
+            books = [book.format() for book in Book.query.order_by(Book.id).all()]
+
+        for page in [1, 2]:
+            res = self.client().get('/books?page={}'.format(page))
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(json.loads(res.data)['books'], books[(page - 1) * 8:page * 8])
+
+    def test_fast_json_books_match_jsonify(self):
+        fast_app = create_app({'FAST_JSON': True})
+        setup_db(fast_app, self.database_path)
+
+        for page in [1, 2]:
+            fast = fast_app.test_client().get('/books?page={}'.format(page))
+            slow = self.client().get('/books?page={}'.format(page))
+
+            self.assertEqual(fast.status_code, 200)
+            self.assertEqual(fast.content_type, slow.content_type)
+            self.assertEqual(json.loads(fast.data), json.loads(slow.data))
     
     def test_404_sent_requesting_beyond_valid_page(self):
         res = self.client().get('/books?page=1000', json={'rating': 1})